@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Benchmark the block's software tools on synthetic data.
+
+Generates synthetic inputs (see synthetic.py), runs each tool the way the
+workflow does and records wall time, CPU time, peak RSS and rows/s per tool.
+Results are written as JSON together with the git commit, so runs on different
+commits can be compared with --compare.
+
+Inputs are generated in a separate process: a child's peak RSS on Linux starts
+from the parent's RSS at fork time, so this process stays small (no polars
+loaded) until all tools have run.
+
+Tools run in workflow order, each consuming the previous tool's output where the
+workflow does: filter -> sample -> spectratype / assembling-fasta; anarci-kabat
+runs on the synthetic ANARCI CSVs and umap on its own (smaller) input.
+
+Usage:
+    python benchmarks/run.py --rows 100000 --out results.json
+    python benchmarks/run.py --rows 1000000 --tools filter,sample --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SOFTWARE = os.path.join(REPO_ROOT, 'software')
+SYNTHETIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'synthetic.py')
+# Written by synthetic.py next to the inputs: their paths, row counts and filter/ranking settings
+SYNTHETIC_MANIFEST = 'manifest.json'
+TOOLS = ['filter', 'sample', 'spectratype', 'assembling-fasta', 'anarci-kabat', 'umap']
+
+
+def run_tool(python, script, args, rows, log_path, metrics_path):
+    """
+    Run one tool as a subprocess and measure it.
+
+    Returns:
+        dict: wall/CPU seconds, peak RSS of the tool process, rows/s, exit code
+        and the tool's own per-stage records (--metrics-out)
+    """
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)  # the tools append
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([python, script] + args + ['--metrics-out', metrics_path],
+                                   stdout=log, stderr=subprocess.STDOUT)
+        # wait4 reports resource usage of exactly this child
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    stages = []
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as f:
+            stages = [json.loads(line) for line in f if line.strip()]
+    return {
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        'peak_rss_mb': round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        'rows': rows,
+        'rows_per_second': round(rows / wall) if rows is not None and wall > 0 else None,
+        'exit_code': os.waitstatus_to_exitcode(status),
+        'log': log_path,
+        'stages': [{k: v for k, v in stage.items() if k not in ('tool', 'timestamp', 'pid')}
+                   for stage in stages if stage['stage'] != 'total'],
+    }
+
+
+def tool_commands(data, work_dir, threads):
+    """Command line (script, args, input rows) for each tool, wired like the workflow."""
+    paths = data['paths']
+
+    def out(name):
+        return os.path.join(work_dir, name)
+
+    sample_args = ['--parquet', out('filteredClonotypes.parquet'), '--n', str(max(data['rows'] // 10, 1)),
+                   '--ranking-map', json.dumps(data['ranking_map']),
+                   '--selection-in', out('selection.parquet'), '--selection-out', out('selection_out.parquet'),
+                   '--out', out('sampledClonotypes_top.parquet')]
+    if data['diversification_column']:
+        sample_args += ['--diversification-column', data['diversification_column']]
+
+    kabat_args = ['--h_csv', paths['anarci_H'], '--out_tsv', out('kabat.tsv'),
+                  '--numbered_count_file', out('numbered_count.txt')]
+    if 'anarci_KL' in paths:
+        kabat_args += ['--kl_csv', paths['anarci_KL']]
+
+    return {
+        'filter': (os.path.join(SOFTWARE, 'sample-clonotypes', 'src', 'filter.py'),
+                   ['--parquet', paths['clones'], '--out', out('filteredClonotypes.parquet'),
+                    '--filter-map', json.dumps(data['filter_map']),
+                    '--emit-selection', out('selection.parquet')],
+                   data['table_rows']),
+        'sample': (os.path.join(SOFTWARE, 'sample-clonotypes', 'src', 'main.py'), sample_args, None),
+        'spectratype': (os.path.join(SOFTWARE, 'spectratype', 'src', 'main.py'),
+                        ['--input_parquet', paths['cdr3'], '--spectratype_tsv', out('spectratype.tsv'),
+                         '--vj_usage_tsv', out('vj_usage.tsv'),
+                         '--final-clonotypes', out('sampledClonotypes_top.parquet')],
+                        data['rows']),
+        'assembling-fasta': (os.path.join(SOFTWARE, 'assembling-fasta', 'src', 'main.py'),
+                             ['--input_parquet', paths['assembling'], '--key_column', 'clonotypeKey',
+                              '--output_fasta', out('assembling.fasta'),
+                              '--final-clonotypes', out('sampledClonotypes_top.parquet')],
+                             data['rows']),
+        'anarci-kabat': (os.path.join(SOFTWARE, 'anarci-kabat', 'src', 'main.py'), kabat_args, data['rows']),
+        'umap': (os.path.join(SOFTWARE, 'umap', 'src', 'main.py'),
+                 ['-i', paths['umap'], '-u', out('umap.parquet'), '--threads', str(threads)],
+                 data['umap_rows']),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print per-tool and per-stage wall time and peak RSS ratios against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison against {baseline_path} (commit {baseline.get('commit')}):")
+    print(f"{'tool':<18}{'wall':>12}{'base wall':>12}{'ratio':>8}{'rss MB':>10}{'base rss':>10}{'ratio':>8}")
+    for tool, result in results['tools'].items():
+        base = baseline.get('tools', {}).get(tool)
+        if not base:
+            continue
+        wall_ratio = result['wall_seconds'] / base['wall_seconds'] if base['wall_seconds'] else float('nan')
+        rss_ratio = result['peak_rss_mb'] / base['peak_rss_mb'] if base['peak_rss_mb'] else float('nan')
+        print(f"{tool:<18}{result['wall_seconds']:>12.3f}{base['wall_seconds']:>12.3f}{wall_ratio:>8.2f}"
+              f"{result['peak_rss_mb']:>10.1f}{base['peak_rss_mb']:>10.1f}{rss_ratio:>8.2f}")
+        base_stages = {stage['stage']: stage for stage in base.get('stages', [])}
+        for stage in result.get('stages', []):
+            base_stage = base_stages.get(stage['stage'])
+            if not base_stage:
+                continue
+            ratio = stage['wall_seconds'] / base_stage['wall_seconds'] if base_stage['wall_seconds'] else float('nan')
+            print(f"  {stage['stage']:<16}{stage['wall_seconds']:>12.3f}{base_stage['wall_seconds']:>12.3f}{ratio:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the software tools on synthetic clonotype data.')
+    parser.add_argument('--rows', type=int, default=100_000, help='Number of clonotypes (default: 100000)')
+    parser.add_argument('--filter-columns', type=int, default=4, help='Number of Filter_* columns')
+    parser.add_argument('--col-columns', type=int, default=3, help='Number of Col* ranking columns')
+    parser.add_argument('--cluster-columns', type=int, default=1, help='Number of Col_cluster.* columns')
+    parser.add_argument('--linker-columns', type=int, default=1, help='Number of linkers (Col_linker.*)')
+    parser.add_argument('--samples', type=int, default=1, help='Number of samples (sampleId multiplicity)')
+    parser.add_argument('--chains', type=int, choices=[1, 2], default=2, help='Number of chains')
+    parser.add_argument('--umap-rows', type=int, default=20_000,
+                        help='Number of clonotypes in the UMAP input (default: 20000)')
+    parser.add_argument('--tools', default=','.join(TOOLS),
+                        help=f'Comma-separated tools to run (default: {",".join(TOOLS)}); '
+                             'sample, spectratype and assembling-fasta need the output of filter/sample')
+    parser.add_argument('--threads', type=int, default=1, help='Threads passed to multi-threaded tools')
+    parser.add_argument('--python', default=sys.executable, help='Python interpreter to run the tools with')
+    parser.add_argument('--work-dir', help='Directory for inputs, outputs and logs (default: temporary)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--out', help='Write results JSON to this file')
+    parser.add_argument('--compare', help='Previous results JSON to compare against')
+    args = parser.parse_args()
+
+    tools = [t.strip() for t in args.tools.split(',') if t.strip()]
+    unknown = [t for t in tools if t not in TOOLS]
+    if unknown:
+        parser.error(f"unknown tools: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.work_dir or tmp
+        os.makedirs(work_dir, exist_ok=True)
+
+        print(f"Generating {args.rows} synthetic clonotypes in {work_dir}...")
+        start = time.perf_counter()
+        input_dir = os.path.join(work_dir, 'input')
+        subprocess.run([sys.executable, SYNTHETIC, '--out-dir', input_dir, '--rows', str(args.rows),
+                        '--filter-columns', str(args.filter_columns), '--col-columns', str(args.col_columns),
+                        '--cluster-columns', str(args.cluster_columns),
+                        '--linker-columns', str(args.linker_columns), '--samples', str(args.samples),
+                        '--chains', str(args.chains), '--umap-rows', str(args.umap_rows),
+                        '--seed', str(args.seed)], check=True, stdout=subprocess.DEVNULL)
+        with open(os.path.join(input_dir, SYNTHETIC_MANIFEST)) as f:
+            data = json.load(f)
+        print(f"Generated in {time.perf_counter() - start:.1f}s")
+
+        commands = tool_commands(data, work_dir, args.threads)
+        results = {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': {'platform': platform.platform(), 'cpus': os.cpu_count()},
+            'params': {k: v for k, v in vars(args).items() if k not in ('out', 'compare', 'work_dir', 'python')},
+            'tools': {},
+        }
+        for tool in tools:
+            script, tool_args, rows = commands[tool]
+            result = run_tool(args.python, script, tool_args, rows, os.path.join(work_dir, f'{tool}.log'),
+                              os.path.join(work_dir, f'{tool}.metrics.jsonl'))
+            results['tools'][tool] = result
+            status = 'ok' if result['exit_code'] == 0 else f"FAILED (exit {result['exit_code']})"
+            print(f"{tool:<18}{result['wall_seconds']:>9.3f}s {result['cpu_seconds']:>9.3f}s cpu "
+                  f"{result['peak_rss_mb']:>9.1f} MB  {status}")
+            if result['exit_code'] != 0:
+                with open(result['log']) as log:
+                    print(''.join(log.readlines()[-20:]), file=sys.stderr)
+
+        if 'sample' in results['tools']:
+            # sample runs on the filter output; count it only now that no more tools are forked
+            import polars as pl
+            filtered = commands['sample'][1][1]
+            rows = pl.scan_parquet(filtered).select(pl.len()).collect().item() if os.path.exists(filtered) else 0
+            result = results['tools']['sample']
+            result['rows'] = rows
+            result['rows_per_second'] = round(rows / result['wall_seconds']) if result['wall_seconds'] > 0 else None
+
+    print(f"\n{'tool':<18}{'rows':>12}{'rows/s':>14}")
+    for tool, result in results['tools'].items():
+        print(f"{tool:<18}{result['rows']:>12,}{result['rows_per_second'] or 0:>14,}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Synthetic clonotype data for benchmarking the block's software tools.
+
+Generates, for a given number of clonotypes, the inputs each tool receives from
+the workflow:
+
+  clones.parquet       clone table for filter.py / sample-clonotypes main.py:
+                       clonotypeKey, Filter_*, Col*, Col_cluster.*, Col_linker.*.*,
+                       clusterAxis_*_0 and, with --samples > 1, one row per
+                       (sampleId, clonotype) plus inVivo_* columns
+  cdr3.parquet         spectratype input: cdr3Sequence.<chain>, vGene.<chain>, jGene.<chain>
+  assembling.parquet   assembling-fasta input: assemblingFeature.<chain> VDJ sequences
+  anarci_H.csv,        ANARCI KABAT-numbered CSVs for anarci-kabat
+  anarci_KL.csv
+  umap.parquet         UMAP tool input: clonotypeKey + aaSequence.<chain>
+
+All data is random but shaped like real repertoires: CDR3s are mutated copies of
+clonal family templates framed by chain-specific motifs, VDJ sequences are
+mutated germline frameworks around the CDR3, and gene usage is skewed.
+
+Usage:
+    python benchmarks/synthetic.py --rows 100000 --out-dir /tmp/synthetic
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import polars as pl
+
+MANIFEST_FILE = 'manifest.json'
+AMINO_ACIDS = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWY', dtype=np.uint8)
+
+# Chain label -> (CDR3 prefix, CDR3 suffix, V gene prefix, J gene prefix, framework 4)
+CHAINS = {
+    'Heavy': ('CAR', 'FDYW', 'IGHV', 'IGHJ', 'GQGTLVTVSS'),
+    'Light': ('CQQ', 'TF', 'IGKV', 'IGKJ', 'GQGTKVEIK'),
+    'TRA': ('CAV', 'KLTF', 'TRAV', 'TRAJ', 'GKGTKLSVK'),
+    'TRB': ('CASS', 'EQYF', 'TRBV', 'TRBJ', 'GPGTRLTVL'),
+}
+
+# KABAT positions of a variable domain, with the insertion codes ANARCI emits
+KABAT_POSITIONS = {
+    'H': ([str(i) for i in range(1, 36)] + ['35A', '35B'] + [str(i) for i in range(36, 53)]
+          + ['52A', '52B', '52C'] + [str(i) for i in range(53, 83)] + ['82A', '82B', '82C']
+          + [str(i) for i in range(83, 101)] + [f'100{c}' for c in 'ABCDEFGHIJK']
+          + [str(i) for i in range(101, 114)]),
+    'KL': ([str(i) for i in range(1, 28)] + [f'27{c}' for c in 'ABCDEF']
+           + [str(i) for i in range(28, 96)] + [f'95{c}' for c in 'ABCDEF']
+           + [str(i) for i in range(96, 108)]),
+}
+ANARCI_META_COLUMNS = ['Id', 'domain_no', 'hmm_species', 'chain_type', 'e-value', 'score',
+                       'seqstart_index', 'seqend_index', 'identity_species', 'v_gene',
+                       'v_identity', 'j_gene', 'j_identity']
+
+
+def random_codes(rng, lengths):
+    """Matrix of random amino acid codes, one row per length, zero-padded on the right."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    width = max(int(lengths.max()) if len(lengths) else 0, 1)
+    codes = rng.choice(AMINO_ACIDS, size=(len(lengths), width))
+    codes[np.arange(width) >= lengths[:, None]] = 0
+    return codes
+
+
+def mutate(rng, codes, rate):
+    """Replace each (non-padding) code with a random amino acid with probability `rate`."""
+    codes = codes.copy()
+    mutated = (rng.random(codes.shape) < rate) & (codes != 0)
+    codes[mutated] = rng.choice(AMINO_ACIDS, size=int(mutated.sum()))
+    return codes
+
+
+def to_strings(codes):
+    """Convert a zero-padded code matrix to a string Series without a per-row Python loop."""
+    codes = np.ascontiguousarray(codes, dtype=np.uint8)
+    return pl.Series(codes.view(f'S{codes.shape[1]}').ravel()).cast(pl.Utf8)
+
+
+def concat(*parts):
+    """Row-wise concatenation of string Series and string literals."""
+    return pl.select(pl.concat_str([pl.lit(part) for part in parts])).to_series()
+
+
+def skewed_choice(rng, n_values, size):
+    """Zipf-like index choice: a few values are frequent, most are rare."""
+    weights = 1.0 / np.arange(1, n_values + 1)
+    return rng.choice(n_values, size=size, p=weights / weights.sum())
+
+
+def cdr3_sequences(rng, rows, chain='Heavy', families=None):
+    """CDR3 amino acid sequences: mutated copies of clonal family cores between
+    the chain's conserved motifs."""
+    prefix, suffix = CHAINS[chain][:2]
+    families = families or max(rows // 20, 1)
+    cores = random_codes(rng, rng.integers(5, 16, size=families))
+    family = skewed_choice(rng, families, rows)
+    return concat(prefix, to_strings(mutate(rng, cores[family], 0.1)), suffix)
+
+
+def gene_names(rng, rows, prefix, n_genes):
+    """Gene names with skewed usage, e.g. IGHV3-23*01."""
+    genes = pl.Series([f'{prefix}{i // 10 + 1}-{i % 10 + 1}*01' for i in range(n_genes)])
+    return genes.gather(skewed_choice(rng, n_genes, rows))
+
+
+def vdj_sequences(rng, cdr3, chain='Heavy', n_germlines=50):
+    """VDJ region sequences: mutated germline frameworks (FR1-FR3) + CDR3 + FR4."""
+    germlines = random_codes(rng, rng.integers(92, 99, size=n_germlines))
+    germline = skewed_choice(rng, n_germlines, len(cdr3))
+    return concat(to_strings(mutate(rng, germlines[germline], 0.05)), cdr3, CHAINS[chain][4])
+
+
+def clone_table(rng, keys, filter_columns, col_columns, cluster_columns, linker_columns,
+                samples=1, clusters=None):
+    """Clone table as built by the workflow for filter.py and sample-clonotypes main.py."""
+    rows = len(keys)
+    clusters = clusters or max(rows // 50, 1)
+    columns = {'clonotypeKey': keys}
+    for i in range(filter_columns):
+        # Alternate numeric and string filter columns
+        if i % 2 == 0:
+            columns[f'Filter_{i}'] = rng.lognormal(0, 1, rows)
+        else:
+            columns[f'Filter_{i}'] = gene_names(rng, rows, 'IGHV', 40)
+    for i in range(col_columns):
+        columns[f'Col{i}'] = rng.random(rows)
+    for i in range(cluster_columns):
+        columns[f'Col_cluster.{i}'] = rng.random(rows)
+    for i in range(linker_columns):
+        cluster = skewed_choice(rng, clusters, rows)
+        columns[f'clusterAxis_{i}_0'] = pl.Series([f'cluster{c}' for c in range(clusters)]).gather(cluster)
+        columns[f'Col_linker.{i}.0'] = rng.random(clusters)[cluster]
+    df = pl.DataFrame(columns)
+
+    if samples > 1:
+        # One row per (sample, clonotype) occurrence; clonotypes appear in 1..samples samples
+        occurrences = rng.integers(1, samples + 1, size=rows)
+        row_index = np.repeat(np.arange(rows), occurrences)
+        # Consecutive samples from a random offset, so a clonotype never repeats in a sample
+        within = np.arange(len(row_index)) - np.repeat(np.cumsum(occurrences) - occurrences, occurrences)
+        sample_index = (rng.integers(0, samples, size=rows)[row_index] + within) % samples
+        sample_names = pl.Series([f'sample{s}' for s in range(samples)])
+        df = df[row_index].with_columns(
+            sample_names.gather(sample_index).alias('sampleId'),
+            pl.Series('inVivo_primaryAbundance', rng.integers(1, 10_000, size=len(row_index))),
+        ).with_columns(
+            pl.Series('inVivo_fractionCDR', rng.random(rows)[row_index]),
+            pl.Series('inVivo_nMutations', rng.integers(0, 40, size=rows)[row_index]),
+        )
+    return df
+
+
+def filter_map(df):
+    """Filter specs for the Filter_* columns keeping roughly half of the clonotypes per stage."""
+    specs = {}
+    for column in df.columns:
+        if not column.startswith('Filter_'):
+            continue
+        if df.schema[column] == pl.Utf8:
+            top = df[column].value_counts(sort=True)[column].head(10).to_list()
+            specs[column] = {'type': 'string_in', 'reference': json.dumps(top), 'valueType': 'String'}
+        else:
+            specs[column] = {'type': 'number_greaterThan', 'reference': float(df[column].quantile(0.3)),
+                             'valueType': 'Double'}
+    return specs
+
+
+def ranking_map(df, in_vivo=False):
+    """Ranking directions for all Col* columns (and In Vivo Score when sample data is present)."""
+    ranking = {c: ('decreasing' if i % 2 == 0 else 'increasing')
+               for i, c in enumerate(c for c in df.columns if c.startswith('Col'))}
+    if in_vivo:
+        ranking['inVivoScore'] = 'decreasing'
+    return ranking
+
+
+def anarci_csv(rng, keys, vdj, chain_type, path):
+    """Write an ANARCI KABAT CSV: metadata columns followed by one column per position."""
+    positions = KABAT_POSITIONS[chain_type]
+    rows = len(keys)
+    codes = rng.choice(AMINO_ACIDS, size=(rows, len(positions)))
+    # Insertion positions are mostly gaps
+    insertion = np.array([not p.isdigit() for p in positions])
+    gaps = rng.random((rows, len(positions))) < np.where(insertion, 0.8, 0.02)
+    codes[gaps] = ord('-')
+    chain_label = 'Heavy' if chain_type == 'H' else 'Light'
+    df = pl.DataFrame({'Id': concat(keys, f'|assemblingFeature.{chain_label}')}).with_columns(
+        pl.lit(0).alias('domain_no'), pl.lit('human').alias('hmm_species'),
+        pl.lit(chain_type).alias('chain_type'), pl.lit(1e-50).alias('e-value'), pl.lit(150.0).alias('score'),
+        pl.lit(0).alias('seqstart_index'), (vdj.str.len_chars() - 1).alias('seqend_index'),
+        pl.lit('human').alias('identity_species'), pl.lit('IGHV3-23*01').alias('v_gene'),
+        pl.lit(0.95).alias('v_identity'), pl.lit('IGHJ4*01').alias('j_gene'), pl.lit(0.9).alias('j_identity'),
+    ).select(ANARCI_META_COLUMNS)
+    position_df = pl.DataFrame(codes.view('S1'), schema=positions, orient='row').cast(pl.Utf8)
+    pl.concat([df, position_df], how='horizontal').write_csv(path)
+
+
+def generate(out_dir, rows, filter_columns=4, col_columns=3, cluster_columns=1, linker_columns=1,
+             samples=1, chains=2, umap_rows=None, seed=0):
+    """
+    Generate all synthetic inputs into out_dir.
+
+    Args:
+        out_dir (str): Output directory
+        rows (int): Number of clonotypes
+        filter_columns (int): Number of Filter_* columns
+        col_columns (int): Number of Col* ranking columns
+        cluster_columns (int): Number of Col_cluster.* ranking columns
+        linker_columns (int): Number of linkers (Col_linker.*.0 + clusterAxis_*_0)
+        samples (int): Number of samples; > 1 adds sampleId rows and inVivo_* columns
+        chains (int): Number of chains (1: Heavy, 2: Heavy + Light)
+        umap_rows (int): Number of clonotypes in the UMAP input (default: rows)
+        seed (int): Random seed
+
+    Returns:
+        dict: Paths of the generated files and the filter/ranking maps
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    keys = pl.select(pl.format('clonotype{}', pl.int_range(rows).cast(pl.Utf8).str.zfill(8))).to_series()
+    chain_names = ['Heavy', 'Light'][:chains]
+
+    clones = clone_table(rng, keys, filter_columns, col_columns, cluster_columns, linker_columns, samples)
+    paths = {name: os.path.join(out_dir, file) for name, file in (
+        ('clones', 'clones.parquet'), ('cdr3', 'cdr3.parquet'), ('assembling', 'assembling.parquet'),
+        ('anarci_H', 'anarci_H.csv'), ('anarci_KL', 'anarci_KL.csv'), ('umap', 'umap.parquet'),
+    )}
+    clones.write_parquet(paths['clones'])
+
+    cdr3_columns, assembling_columns = {'clonotypeKey': keys}, {'clonotypeKey': keys}
+    for chain in chain_names:
+        _, _, v_prefix, j_prefix, _ = CHAINS[chain]
+        cdr3 = cdr3_sequences(rng, rows, chain)
+        cdr3_columns[f'cdr3Sequence.{chain}'] = cdr3
+        cdr3_columns[f'vGene.{chain}'] = gene_names(rng, rows, v_prefix, 60)
+        cdr3_columns[f'jGene.{chain}'] = gene_names(rng, rows, j_prefix, 6)
+        assembling_columns[f'assemblingFeature.{chain}'] = vdj_sequences(rng, cdr3, chain)
+    pl.DataFrame(cdr3_columns).write_parquet(paths['cdr3'])
+    assembling = pl.DataFrame(assembling_columns)
+    assembling.write_parquet(paths['assembling'])
+
+    anarci_csv(rng, keys, assembling['assemblingFeature.Heavy'], 'H', paths['anarci_H'])
+    if chains > 1:
+        anarci_csv(rng, keys, assembling['assemblingFeature.Light'], 'KL', paths['anarci_KL'])
+    else:
+        paths.pop('anarci_KL')
+
+    umap_rows = min(umap_rows or rows, rows)
+    pl.DataFrame(cdr3_columns).head(umap_rows).select(
+        pl.col('clonotypeKey'),
+        *[pl.col(f'cdr3Sequence.{chain}').alias(f'aaSequence.{chain}') for chain in chain_names],
+    ).write_parquet(paths['umap'])
+
+    return {
+        'paths': paths,
+        'rows': rows,
+        'table_rows': clones.height,
+        'umap_rows': umap_rows,
+        'filter_map': filter_map(clones),
+        'ranking_map': ranking_map(clones, in_vivo=samples > 1),
+        'diversification_column': 'clusterAxis_0_0' if linker_columns else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic clonotype inputs for benchmarks.')
+    parser.add_argument('--out-dir', required=True, help='Output directory')
+    parser.add_argument('--rows', type=int, default=100_000, help='Number of clonotypes (default: 100000)')
+    parser.add_argument('--filter-columns', type=int, default=4, help='Number of Filter_* columns')
+    parser.add_argument('--col-columns', type=int, default=3, help='Number of Col* ranking columns')
+    parser.add_argument('--cluster-columns', type=int, default=1, help='Number of Col_cluster.* columns')
+    parser.add_argument('--linker-columns', type=int, default=1, help='Number of linkers (Col_linker.*)')
+    parser.add_argument('--samples', type=int, default=1, help='Number of samples (sampleId multiplicity)')
+    parser.add_argument('--chains', type=int, choices=[1, 2], default=2, help='Number of chains')
+    parser.add_argument('--umap-rows', type=int, help='Number of clonotypes in the UMAP input (default: rows)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    info = generate(args.out_dir, args.rows, args.filter_columns, args.col_columns, args.cluster_columns,
+                    args.linker_columns, args.samples, args.chains, args.umap_rows, args.seed)
+    with open(os.path.join(args.out_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(info, f, indent=2)
+    print(json.dumps(info, indent=2))
+
+
+if __name__ == '__main__':
+    main()
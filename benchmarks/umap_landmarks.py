@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Compare landmark UMAP (fit on a stratified subsample, project the rest) against
+a full UMAP fit on synthetic CDR3-like sequences.
+
+Reports wall time of both modes (after a warm-up that JIT-compiles the UMAP
+kernels) and trustworthiness of the embeddings on a holdout of points that were
+not used as landmarks.
+
+Usage:
+    python benchmarks/umap_landmarks.py --rows 200000 --landmarks 50000 --json-out landmarks.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'software', 'umap', 'src'))
+import main as umap_tool  # noqa: E402
+
+
+def synthetic_sequences(rows, families, seed):
+    """CDR3-like sequences: mutated copies of random family templates with
+    variable-length junctions."""
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list(umap_tool.AMINO_ACIDS))
+    templates = [''.join(rng.choice(alphabet, size=rng.integers(6, 16))) for _ in range(families)]
+    family = rng.integers(0, families, size=rows)
+    sequences = []
+    for f in family:
+        seq = np.array(list(templates[f]))
+        mutated = rng.random(len(seq)) < 0.15
+        seq[mutated] = rng.choice(alphabet, size=int(mutated.sum()))
+        sequences.append('CAR' + ''.join(seq) + ''.join(rng.choice(alphabet, size=rng.integers(0, 4))) + 'FDYW')
+    return sequences
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark landmark UMAP against a full fit.')
+    parser.add_argument('--rows', type=int, default=50000, help='Number of synthetic sequences')
+    parser.add_argument('--landmarks', type=int, default=10000, help='Number of landmarks')
+    parser.add_argument('--holdout', type=int, default=2000, help='Number of holdout points for trustworthiness')
+    parser.add_argument('--families', type=int, default=200, help='Number of sequence families')
+    parser.add_argument('--k-mer-size', type=int, default=3)
+    parser.add_argument('--dr-components', type=int, default=5)
+    parser.add_argument('--umap-neighbors', type=int, default=8)
+    parser.add_argument('--umap-min-dist', type=float, default=0.05)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json-out', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.manifold import trustworthiness
+
+    sequences = synthetic_sequences(args.rows, args.families, args.seed)
+    lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    matrix, _ = umap_tool.kmer_count_vectors(sequences, k=args.k_mer_size, threads=args.threads)
+    data = TruncatedSVD(n_components=args.dr_components, random_state=args.seed).fit_transform(matrix)
+
+    # Holdout: points that are not landmarks, so landmark mode had to project them
+    landmarks = umap_tool.select_landmarks(lengths, args.landmarks)
+    candidates = np.setdiff1d(np.arange(args.rows), landmarks)
+    rng = np.random.default_rng(args.seed)
+    holdout = np.sort(rng.choice(candidates, size=min(args.holdout, len(candidates)), replace=False))
+
+    # Warm up: compile umap-learn/pynndescent kernels for both fit and transform
+    # so that neither mode pays numba JIT time
+    warmup_rows = min(args.rows, umap_tool.MIN_LANDMARKS + 2000)
+    umap_tool.fit_umap(data[:warmup_rows], argparse.Namespace(
+        umap_components=2, umap_neighbors=args.umap_neighbors, umap_min_dist=args.umap_min_dist,
+        landmarks=umap_tool.MIN_LANDMARKS, threads=1), strata=lengths[:warmup_rows])
+
+    results = {'rows': args.rows, 'landmarks': args.landmarks, 'holdout': len(holdout),
+               'k_mer_size': args.k_mer_size, 'threads': args.threads}
+    for mode, n_landmarks in (('full', 0), ('landmark', args.landmarks)):
+        fit_args = argparse.Namespace(
+            umap_components=2, umap_neighbors=args.umap_neighbors, umap_min_dist=args.umap_min_dist,
+            landmarks=n_landmarks, threads=args.threads)
+        start = time.perf_counter()
+        _, embedding = umap_tool.fit_umap(data, fit_args, strata=lengths)
+        elapsed = time.perf_counter() - start
+        score = trustworthiness(data[holdout], embedding[holdout], n_neighbors=args.umap_neighbors)
+        results[mode] = {'seconds': round(elapsed, 3), 'trustworthiness': round(float(score), 4)}
+        print(f"{mode}: {elapsed:.3f}s, trustworthiness {score:.4f}")
+
+    results['speedup'] = round(results['full']['seconds'] / results['landmark']['seconds'], 2)
+    print(json.dumps(results, indent=2))
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
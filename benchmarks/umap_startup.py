@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Measure start-up cost of the UMAP tool: time to parse arguments (module import
+cost), and wall time of a small run with an empty numba cache (cold) and with the
+cache filled by a previous run (warm).
+
+Usage:
+    python benchmarks/umap_startup.py --rows 5000 --json-out startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from umap_landmarks import synthetic_sequences
+
+UMAP_TOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'software', 'umap', 'src', 'main.py')
+
+
+def timed_run(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, UMAP_TOOL] + args, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return round(time.perf_counter() - start, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cold and warm start of the UMAP tool.')
+    parser.add_argument('--rows', type=int, default=5000, help='Number of synthetic sequences')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json-out', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_tsv = os.path.join(tmp, 'input.tsv')
+        with open(input_tsv, 'w') as f:
+            f.write('clonotypeKey\taaSequence\n')
+            for i, seq in enumerate(synthetic_sequences(args.rows, 100, args.seed)):
+                f.write(f'k{i}\t{seq}\n')
+
+        def run_args(cache_dir):
+            return ['-i', input_tsv, '-u', 'umap.tsv', '--output-dir', tmp,
+                    '--numba-cache-dir', cache_dir, '--threads', '1']
+
+        run_cache_dir = os.path.join(tmp, 'numba-cache-run')
+        results = {
+            'rows': args.rows,
+            'help_seconds': timed_run(['--help']),
+            'cold_seconds': timed_run(run_args(run_cache_dir)),
+            'warm_seconds': timed_run(run_args(run_cache_dir)),
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,8 @@ from typing import Dict, List, Tuple, Optional
 
 import polars as pl
 
+from metrics import Metrics
+
 
 def load_anarci_csv(path: Optional[str]) -> Tuple[Optional[Dict[str, str]], Optional[List[str]]]:
     if not path or not os.path.exists(path):
@@ -86,15 +88,26 @@ def main() -> None:
     p.add_argument("--kl_csv", required=False, help="Path to KL chain ANARCI CSV")
     p.add_argument("--out_tsv", required=True, help="Output KABAT TSV path")
     p.add_argument("--numbered_count_file", required=False, help="File to write count of numbered clonotypes")
+    p.add_argument("--metrics-out", required=False, help="Append per-stage metrics (JSON lines) to this file")
     args = p.parse_args()
     print(args)
-
-    h_rows, h_pos = load_anarci_csv(args.h_csv)
-    kl_rows, kl_pos = load_anarci_csv(args.kl_csv)
-    write_kabat_tsv(args.out_tsv, h_rows, h_pos, kl_rows, kl_pos)
+    metrics = Metrics("anarci-kabat", args.metrics_out)
+
+    with metrics.stage("load_h") as stage:
+        h_rows, h_pos = load_anarci_csv(args.h_csv)
+        stage.rows_out = len(h_rows or {})
+    with metrics.stage("load_kl") as stage:
+        kl_rows, kl_pos = load_anarci_csv(args.kl_csv)
+        stage.rows_out = len(kl_rows or {})
+    metrics.rows(rows_in=len(h_rows or {}) + len(kl_rows or {}))
+
+    numbered = len(set(h_rows or {}) | set(kl_rows or {}))
+    with metrics.stage("write", rows_in=numbered) as stage:
+        write_kabat_tsv(args.out_tsv, h_rows, h_pos, kl_rows, kl_pos)
+        stage.rows_out = numbered
+    metrics.rows(rows_out=numbered)
 
     if args.numbered_count_file:
-        numbered = len(set(h_rows or {}) | set(kl_rows or {}))
         with open(args.numbered_count_file, "w") as f:
             f.write(str(numbered))
 
@@ -1,32 +1,41 @@
 import argparse
 import sys
 from typing import List
-import polars as pl
 
+from metrics import Metrics
+import table_io
 
-def to_fasta(input_parquet: str, key_column: str, output_fasta: str, final_clonotypes: str | None = None) -> None:
+
+def to_fasta(input_parquet: str, key_column: str, output_fasta: str, final_clonotypes: str | None = None,
+             metrics: Metrics | None = None) -> None:
+    metrics = metrics or Metrics("assembling-fasta")
     keys: set[str] | None = None
     if final_clonotypes:
         keys = set()
-        # Read final clonotypes from Parquet
-        final_df = pl.read_parquet(final_clonotypes)
-        # Prefer explicit key columns if present
-        key_field = None
-        if "clonotypeKey" in final_df.columns:
-            key_field = "clonotypeKey"
-        elif "scClonotypeKey" in final_df.columns:
-            key_field = "scClonotypeKey"
-        elif len(final_df.columns) > 0:
-            key_field = final_df.columns[0]
-        
-        if key_field:
-            for row in final_df.to_dicts():
-                key_value = row.get(key_field)
-                if key_value is not None:
-                    keys.add(str(key_value))
+        with metrics.stage("load_final_clonotypes") as stage:
+            # Read final clonotypes from Parquet (or Arrow IPC)
+            final_df = table_io.read_polars(final_clonotypes)
+            # Prefer explicit key columns if present
+            key_field = None
+            if "clonotypeKey" in final_df.columns:
+                key_field = "clonotypeKey"
+            elif "scClonotypeKey" in final_df.columns:
+                key_field = "scClonotypeKey"
+            elif len(final_df.columns) > 0:
+                key_field = final_df.columns[0]
+
+            if key_field:
+                for row in final_df.to_dicts():
+                    key_value = row.get(key_field)
+                    if key_value is not None:
+                        keys.add(str(key_value))
+            stage.rows_out = len(keys)
 
-    # Read parquet file using Polars
-    df = pl.read_parquet(input_parquet)
+    # Read parquet file using Polars (memory-mapped if Arrow IPC)
+    with metrics.stage("load") as stage:
+        df = table_io.read_polars(input_parquet)
+        stage.rows_out = df.height
+    metrics.rows(rows_in=df.height)
     fieldnames: List[str] = list(df.columns)
     
     if key_column not in fieldnames:
@@ -35,7 +44,8 @@ def to_fasta(input_parquet: str, key_column: str, output_fasta: str, final_clono
 
     seq_cols = [c for c in fieldnames if c != key_column]
     
-    with open(output_fasta, "w") as out:
+    records = 0
+    with metrics.stage("write", rows_in=df.height) as stage, open(output_fasta, "w") as out:
         # Iterate over rows as dictionaries
         for row in df.to_dicts():
             key = str(row.get(key_column) or "").strip()
@@ -49,14 +59,18 @@ def to_fasta(input_parquet: str, key_column: str, output_fasta: str, final_clono
                     continue
                 # header contains clonotype key and column header to distinguish chains/features
                 out.write(f">{key}|{c}\n{seq}\n")
+                records += 1
+        stage.rows_out = records
+    metrics.rows(rows_out=records)
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Convert assembling feature Parquet to FASTA")
-    parser.add_argument("--input_parquet", required=True, help="Input Parquet: key + one or more sequence columns")
+    parser.add_argument("--input_parquet", required=True, help="Input Parquet (or Arrow IPC): key + one or more sequence columns")
     parser.add_argument("--key_column", required=True, help="Name of the key column (clonotypeKey or scClonotypeKey)")
     parser.add_argument("--output_fasta", required=True, help="Output FASTA file path")
-    parser.add_argument("--final-clonotypes", required=False, help="Optional Parquet file with allowed keys")
+    parser.add_argument("--final-clonotypes", required=False, help="Optional Parquet (or Arrow IPC) file with allowed keys")
+    parser.add_argument("--metrics-out", required=False, help="Append per-stage metrics (JSON lines) to this file")
 
     args = parser.parse_args()
     to_fasta(
@@ -64,6 +78,7 @@ def main() -> None:
         key_column=args.key_column,
         output_fasta=args.output_fasta,
         final_clonotypes=args.final_clonotypes,
+        metrics=Metrics("assembling-fasta", args.metrics_out),
     )
 
 
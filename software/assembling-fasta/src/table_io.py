@@ -0,0 +1,58 @@
+"""
+Table file formats of the block's tools: Parquet (and TSV where a tool writes
+it) for artifacts the platform imports, and uncompressed Arrow IPC (Feather v2)
+for intermediates passed from one of our tools to another.
+
+As in the UMAP tool, the format is chosen by file extension: .arrow, .ipc and
+.feather are Arrow IPC, anything else the tool's usual format. IPC files are
+written uncompressed and read memory-mapped without rechunking, so "reading"
+one maps the file and its columns are zero-copy views of the page cache —
+there is nothing to decode. (Conversion to pandas still copies.)
+
+Works with polars or pyarrow/pandas, whichever the tool ships with. This module
+is copied verbatim into every tool's src/ that uses it (each tool is packaged
+from its own src/ root); keep the copies identical.
+"""
+
+IPC_SUFFIXES = ('.arrow', '.ipc', '.feather')
+
+
+def is_ipc(path):
+    """Whether path names an Arrow IPC file."""
+    return str(path).lower().endswith(IPC_SUFFIXES)
+
+
+def read_polars(path, columns=None):
+    """Read a Parquet or (memory-mapped) Arrow IPC file into a polars DataFrame."""
+    import polars as pl
+
+    if is_ipc(path):
+        return pl.read_ipc(path, columns=columns, memory_map=True, rechunk=False)
+    return pl.read_parquet(path, columns=columns)
+
+
+def scan_polars(path):
+    """Lazily scan a Parquet or (memory-mapped) Arrow IPC file with polars."""
+    import polars as pl
+
+    if is_ipc(path):
+        return pl.scan_ipc(path, memory_map=True)
+    return pl.scan_parquet(path)
+
+
+def read_pandas(path, columns=None):
+    """Read a Parquet or (memory-mapped) Arrow IPC file into a pandas DataFrame."""
+    if is_ipc(path):
+        import pyarrow.feather as feather
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    import pandas as pd
+    return pd.read_parquet(path, columns=columns)
+
+
+def write_pandas_tsv(df, path):
+    """Write a pandas DataFrame as TSV, or as uncompressed Arrow IPC for an IPC path."""
+    if is_ipc(path):
+        import pyarrow.feather as feather
+        feather.write_feather(df.reset_index(drop=True), path, compression='uncompressed')
+    else:
+        df.to_csv(path, sep="\t", index=False)
@@ -1,79 +1,240 @@
 #!/usr/bin/env python3
 
 import argparse
+import numpy as np
 import polars as pl
 import re
 import os
 import json
+import tempfile
 import time
 
+from memory_budget import (default_memory_budget, estimate_parquet_memory, exceeds_budget, format_size,
+                           parse_memory_size)
+from metrics import Metrics
+import parquet_output
+import table_io
+from result_cache import DEFAULT_CACHE_SIZE, ResultCache, json_param, output_formats
+import worker
+
+# Peak memory of the eager path relative to the decoded input table: the table,
+# its prepared copy, the filtered copy and per-stage key frames
+EAGER_WORKING_SET_FACTOR = 3
+# Row position in the prepared table, the unit of stage checkpoints
+ROW_INDEX_COLUMN = "__row"
+# Columns described in the --emit-summary output, and what is computed for them
+SUMMARY_COLUMN_PATTERN = r'^(Filter_\d+|Col\d+|Col_cluster\.\d+|Col_linker\.\d+(?:\.\d+)?)$'
+SUMMARY_QUANTILES = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+SUMMARY_HISTOGRAM_BINS = 20
+SUMMARY_TOP_CATEGORIES = 20
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Filter rows based on Filter_* columns using provided filter specifications.")
-    parser.add_argument("--parquet", required=True, help="Path to input Parquet file")
-    parser.add_argument("--out", required=True, help="Path to output Parquet file")
+    parser.add_argument("--parquet", required=True, help="Path to input Parquet (or Arrow IPC) file")
+    parser.add_argument("--out", required=True, help="Path to output Parquet file (Arrow IPC for a .arrow name)")
     parser.add_argument("--filter-map", required=True, help="JSON string containing filter mapping")
     parser.add_argument("--emit-selection", required=False, help="Path to output selection stage parquet (clonotypeKey + selectionStage)")
+    parser.add_argument("--emit-summary", required=False,
+                        help="Path to output JSON with per-column summaries of the Filter_*/Col* columns before filtering")
+    parser.add_argument("--metrics-out", required=False, help="Append per-stage metrics (JSON lines) to this file")
+    parser.add_argument("--memory-budget", type=parse_memory_size, required=False,
+                        help="Memory available to the tool, e.g. 16GiB (default: 80%% of the container limit); "
+                             "inputs that would not fit are filtered in streaming mode")
+    parser.add_argument("--cache-dir", required=False,
+                        help="Reuse outputs of earlier runs with the same input and filters from this directory "
+                             "(default: $TOP_ANTIBODIES_CACHE_DIR; no caching if unset)")
+    parser.add_argument("--cache-size", type=parse_memory_size, default=DEFAULT_CACHE_SIZE,
+                        help=f"Size limit of the result cache (default: {DEFAULT_CACHE_SIZE})")
     return parser.parse_args()
 
 
-def apply_filter(df, column_name, filter_type, reference_value):
+def reference_values(reference_value):
+    """Values of a list filter's reference (a JSON array string or a list) as strings."""
+    values = json.loads(reference_value) if isinstance(reference_value, str) else reference_value
+    return [str(v) for v in values]
+
+
+def string_predicate(values, filter_type, reference_value):
     """
-    Apply a filter to a Polars DataFrame column based on the filter type and reference value.
+    Build the Polars predicate of a string_* filter over a String expression.
+
+    Substrings are matched literally; string_matches/string_doesNotMatch search
+    for the reference as a regular expression. string_containsAny and
+    string_doesNotContainAny take a JSON array of substrings and find any of
+    them in one pass over each value (Aho-Corasick).
+
+    Args:
+        values: polars String expression (a column or its categories)
+        filter_type: string_* filter type
+        reference_value: reference value for the filter
+
+    Returns:
+        polars expression, or None for an unknown filter type
+    """
+    if filter_type == "string_equals":
+        return values == str(reference_value)
+    elif filter_type == "string_notEquals":
+        return values != str(reference_value)
+    elif filter_type == "string_contains":
+        return values.str.contains(str(reference_value), literal=True)
+    elif filter_type == "string_doesNotContain":
+        return ~values.str.contains(str(reference_value), literal=True)
+    elif filter_type == "string_matches":
+        return values.str.contains(str(reference_value))
+    elif filter_type == "string_doesNotMatch":
+        return ~values.str.contains(str(reference_value))
+    elif filter_type == "string_containsAny":
+        return values.str.contains_any(reference_values(reference_value))
+    elif filter_type == "string_doesNotContainAny":
+        return ~values.str.contains_any(reference_values(reference_value))
+    elif filter_type == "string_in":
+        return values.is_in(reference_values(reference_value))
+    elif filter_type == "string_notIn":
+        return ~values.is_in(reference_values(reference_value))
+    return None
+
+
+def filter_expression(column_name, filter_type, reference_value, dtype=None):
+    """
+    Build the Polars predicate selecting the rows that pass a filter.
 
     Args:
-        df: polars DataFrame
         column_name: name of the column to filter on
         filter_type: type of filter to apply
         reference_value: reference value for the filter (None for isNA/isNotNA)
+        dtype: polars data type of the column, if known
 
     Returns:
-        polars DataFrame with filtered rows
+        polars expression, true for rows that pass
     """
-
-    print(f"Applying filter: {column_name} {filter_type} {reference_value}")
-
     if filter_type == "isNA":
-        return df.filter(pl.col(column_name).is_null() | (pl.col(column_name).cast(pl.Utf8) == ""))
+        return pl.col(column_name).is_null() | (pl.col(column_name).cast(pl.Utf8) == "")
     elif filter_type == "isNotNA":
-        return df.filter(pl.col(column_name).is_not_null() & (pl.col(column_name).cast(pl.Utf8) != ""))
+        return pl.col(column_name).is_not_null() & (pl.col(column_name).cast(pl.Utf8) != "")
     elif filter_type == "number_greaterThan":
-        return df.filter((pl.col(column_name) > reference_value) & (pl.col(column_name).is_not_nan()))
+        return (pl.col(column_name) > reference_value) & (pl.col(column_name).is_not_nan())
     elif filter_type == "number_greaterThanOrEqualTo":
-        return df.filter((pl.col(column_name) >= reference_value) & (pl.col(column_name).is_not_nan()))
+        return (pl.col(column_name) >= reference_value) & (pl.col(column_name).is_not_nan())
     elif filter_type == "number_lessThan":
-        return df.filter((pl.col(column_name) < reference_value) & (pl.col(column_name).is_not_nan()))
+        return (pl.col(column_name) < reference_value) & (pl.col(column_name).is_not_nan())
     elif filter_type == "number_lessThanOrEqualTo":
-        return df.filter((pl.col(column_name) <= reference_value) & (pl.col(column_name).is_not_nan()))
+        return (pl.col(column_name) <= reference_value) & (pl.col(column_name).is_not_nan())
     elif filter_type == "number_equals":
-        return df.filter((pl.col(column_name) == reference_value) & (pl.col(column_name).is_not_nan()))
+        return (pl.col(column_name) == reference_value) & (pl.col(column_name).is_not_nan())
     elif filter_type == "number_notEquals":
-        return df.filter((pl.col(column_name) != reference_value) & (pl.col(column_name).is_not_nan()))
-    elif filter_type == "string_equals":
-        return df.filter(pl.col(column_name) == str(reference_value))
-    elif filter_type == "string_notEquals":
-        return df.filter(pl.col(column_name) != str(reference_value))
-    elif filter_type == "string_contains":
-        return df.filter(pl.col(column_name).str.contains(str(reference_value)))
-    elif filter_type == "string_doesNotContain":
-        return df.filter(~pl.col(column_name).str.contains(str(reference_value)))
-    elif filter_type == "string_in":
-        values = json.loads(reference_value) if isinstance(reference_value, str) else reference_value
-        return df.filter(pl.col(column_name).is_in([str(v) for v in values]))
-    elif filter_type == "string_notIn":
-        values = json.loads(reference_value) if isinstance(reference_value, str) else reference_value
-        return df.filter(~pl.col(column_name).is_in([str(v) for v in values]))
+        return (pl.col(column_name) != reference_value) & (pl.col(column_name).is_not_nan())
+
+    if isinstance(dtype, (pl.Categorical, pl.Enum)):
+        # Dictionary-encoded column (e.g. genes read from Arrow IPC): evaluate the
+        # filter once per category and select rows by category code
+        categories = pl.col(column_name).cat.get_categories()
+        predicate = string_predicate(categories, filter_type, reference_value)
+        if predicate is not None:
+            return pl.col(column_name).is_in(categories.filter(predicate).implode())
     else:
-        raise ValueError(f"Unknown filter type '{filter_type}' for column \
-                         '{column_name}'. Supported types: number_greaterThan, \
-                            number_greaterThanOrEqualTo, number_lessThan, \
-                            number_lessThanOrEqualTo, number_equals, \
-                            number_notEquals, string_equals, string_notEquals, \
-                            string_contains, string_doesNotContain, \
-                            string_in, string_notIn, isNA, isNotNA")
+        predicate = string_predicate(pl.col(column_name), filter_type, reference_value)
+        if predicate is not None:
+            return predicate
+
+    raise ValueError(f"Unknown filter type '{filter_type}' for column \
+                     '{column_name}'. Supported types: number_greaterThan, \
+                        number_greaterThanOrEqualTo, number_lessThan, \
+                        number_lessThanOrEqualTo, number_equals, \
+                        number_notEquals, string_equals, string_notEquals, \
+                        string_contains, string_doesNotContain, \
+                        string_matches, string_doesNotMatch, \
+                        string_containsAny, string_doesNotContainAny, \
+                        string_in, string_notIn, isNA, isNotNA")
+
+
+def apply_filter(df, column_name, filter_type, reference_value):
+    """
+    Apply a filter to a Polars DataFrame column based on the filter type and reference value.
+
+    Args:
+        df: polars DataFrame
+        column_name: name of the column to filter on
+        filter_type: type of filter to apply
+        reference_value: reference value for the filter (None for isNA/isNotNA)
 
+    Returns:
+        polars DataFrame with filtered rows
+    """
+
+    print(f"Applying filter: {column_name} {filter_type} {reference_value}")
+
+    return df.filter(filter_expression(column_name, filter_type, reference_value, df.schema[column_name]))
 
-def apply_filters(df, filter_map):
+
+def filter_applies(filter_type, data_type):
+    """Whether apply_filters applies a filter: isNA/isNotNA always, others only if they match the value type."""
+    return (filter_type in ("isNA", "isNotNA") or
+            ((data_type == "String") and (filter_type.startswith("string_"))) or
+            ((data_type != "String") and (filter_type.startswith("number_"))))
+
+
+class StageCheckpoints:
+    """
+    Survivor sets after each filter stage, persisted in the result cache so a run
+    whose filters share a prefix with an earlier run resumes after that prefix.
+
+    A checkpoint is a bitmap over the rows of the prepared table (1 bit per row)
+    marking the survivors of stages 1..k, keyed by the input fingerprint, the
+    prepared table's height and the specs of stages 1..k. Without a cache
+    directory nothing is stored and runs start from stage 1.
+
+    Args:
+        cache: ResultCache
+        parquet: input Parquet file the prepared table was read from
+        rows: height of the prepared table
+        fingerprints: cache.fingerprints([parquet]) if already computed
+    """
+
+    def __init__(self, cache, parquet, rows, fingerprints=None):
+        self.cache = cache
+        self.parquet = parquet
+        self.rows = rows
+        # Fingerprinted once: every stage prefix is looked up or saved under its own key
+        self.fingerprints = fingerprints or cache.fingerprints([parquet])
+
+    def _key(self, stage_specs):
+        return self.cache.key("filter-stage", [self.parquet], {'rows': self.rows, 'stages': stage_specs}, ['bitmap'],
+                              fingerprints=self.fingerprints)
+
+    def resume(self, stage_specs):
+        """
+        Number of stages each row survived, over the longest checkpointed prefix of stage_specs.
+
+        Returns:
+            tuple of (resumed stage count, numpy array of per-row survived stage counts or None)
+        """
+        stages_survived = None
+        resumed = 0
+        for k in range(1, len(stage_specs) + 1):
+            entry = self.cache.lookup(self._key(stage_specs[:k]))
+            if entry is None:
+                break
+            bitmap = np.fromfile(os.path.join(entry, 'bitmap'), dtype=np.uint8)
+            survivors = np.unpackbits(bitmap, count=self.rows).astype(np.int64)
+            stages_survived = survivors if stages_survived is None else stages_survived + survivors
+            resumed = k
+        return resumed, stages_survived
+
+    def save(self, stage_specs, survivor_rows, seconds):
+        """Store the survivor row positions after the last stage of stage_specs."""
+        key = self._key(stage_specs)
+        if key is None:
+            return
+        mask = np.zeros(self.rows, dtype=bool)
+        mask[survivor_rows.to_numpy()] = True
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bitmap')
+            np.packbits(mask).tofile(path)
+            self.cache.store(key, {'bitmap': path}, seconds)
+
+
+def apply_filters(df, filter_map, metrics=None, checkpoints=None):
     """
     Apply all filters specified in the filter_map to the DataFrame.
     If filter_map is empty, return the input table with a "top" column added with value 1.
@@ -81,6 +242,8 @@ def apply_filters(df, filter_map):
     Args:
         df: polars DataFrame
         filter_map: dictionary mapping column names to filter specifications
+        metrics: optional Metrics; each filter is recorded as a "filter:<column>" stage
+        checkpoints: optional StageCheckpoints to resume from and save after each stage
 
     Returns:
         tuple of (filtered polars DataFrame, selection stage polars DataFrame)
@@ -96,7 +259,7 @@ def apply_filters(df, filter_map):
         )
         return df.with_columns(pl.lit(1).alias("top")), selection_df
 
-    filtered_df = df.clone()
+    filtered_df = df.with_row_index(ROW_INDEX_COLUMN)
     initial_rows = filtered_df.height
 
     # Find all Filter_* columns in the DataFrame
@@ -108,39 +271,58 @@ def apply_filters(df, filter_map):
 
     n_filters = len(filter_columns)
     selection_parts = []
+    metrics = metrics or Metrics("filter")
+    stage_specs = [[column_name, filter_map[column_name]] for column_name in filter_columns]
+
+    # Skip the stages whose survivors were checkpointed by an earlier run
+    resumed, stages_survived = checkpoints.resume(stage_specs) if checkpoints else (0, None)
+    if resumed:
+        with metrics.stage("resume", rows_in=filtered_df.height) as stage:
+            stage.extra["stages"] = resumed
+            stages_survived = pl.Series("stagesSurvived", stages_survived)
+            eliminated = (filtered_df.select("clonotypeKey", (stages_survived + 1).alias("selectionStage"))
+                          .filter(stages_survived < resumed)
+                          .sort("selectionStage", maintain_order=True))
+            selection_parts.extend(eliminated.partition_by("selectionStage", maintain_order=True))
+            filtered_df = filtered_df.filter(stages_survived == resumed)
+            stage.rows_out = filtered_df.height
+        print(f"Resumed from checkpoint after stage {resumed} of {n_filters}: {filtered_df.height} rows")
+        initial_rows = filtered_df.height
 
     # Apply filters
     for stage_idx, column_name in enumerate(filter_columns, start=1):
+        if stage_idx <= resumed:
+            continue
         filter_spec = filter_map[column_name]
 
         filter_type = filter_spec["type"]
         reference_value = filter_spec.get("reference")
         data_type = filter_spec["valueType"]
 
-        before_keys = filtered_df.select("clonotypeKey")
-
-        # isNA/isNotNA applies to any data type
-        if filter_type in ("isNA", "isNotNA"):
-            filtered_df = apply_filter(filtered_df, column_name, filter_type, reference_value)
-            rows_after_filter = filtered_df.height
-            print(f"Filter '{column_name}' {filter_type}: {initial_rows} -> {rows_after_filter} rows")
-            initial_rows = rows_after_filter
-        # Apply the filter if is correct for the given data type
-        elif (((data_type == "String") and (filter_type.startswith("string_"))) or
-              ((data_type != "String") and (filter_type.startswith("number_")))):
-            filtered_df = apply_filter(filtered_df, column_name, filter_type, reference_value)
-
-            rows_after_filter = filtered_df.height
-            print(f"Filter '{column_name}' {filter_type} {reference_value}: {initial_rows} -> {rows_after_filter} rows")
-            initial_rows = rows_after_filter
-
-        # Track eliminated clones at this stage
-        after_keys = filtered_df.select("clonotypeKey")
-        eliminated = before_keys.join(after_keys, on="clonotypeKey", how="anti")
-        if eliminated.height > 0:
-            selection_parts.append(
-                eliminated.with_columns(pl.lit(stage_idx).cast(pl.Int64).alias("selectionStage"))
-            )
+        with metrics.stage(f"filter:{column_name}", rows_in=filtered_df.height) as stage:
+            stage.extra["filter_type"] = filter_type
+            before_keys = filtered_df.select("clonotypeKey")
+
+            # Apply the filter if is correct for the given data type
+            if filter_applies(filter_type, data_type):
+                filtered_df = apply_filter(filtered_df, column_name, filter_type, reference_value)
+
+                rows_after_filter = filtered_df.height
+                # isNA/isNotNA have no reference value
+                described = filter_type if filter_type in ("isNA", "isNotNA") else f"{filter_type} {reference_value}"
+                print(f"Filter '{column_name}' {described}: {initial_rows} -> {rows_after_filter} rows")
+                initial_rows = rows_after_filter
+
+            # Track eliminated clones at this stage
+            after_keys = filtered_df.select("clonotypeKey")
+            eliminated = before_keys.join(after_keys, on="clonotypeKey", how="anti")
+            if eliminated.height > 0:
+                selection_parts.append(
+                    eliminated.with_columns(pl.lit(stage_idx).cast(pl.Int64).alias("selectionStage"))
+                )
+            stage.rows_out = filtered_df.height
+        if checkpoints:
+            checkpoints.save(stage_specs[:stage_idx], filtered_df[ROW_INDEX_COLUMN], stage.wall)
 
     # Surviving clones get selectionStage = N_filters + 1
     survivors = filtered_df.select("clonotypeKey").with_columns(
@@ -151,7 +333,7 @@ def apply_filters(df, filter_map):
     selection_df = pl.concat(selection_parts)
     print(f"Selection stage tracking: {selection_df.height} total clones across {n_filters} filter stages")
 
-    return filtered_df, selection_df
+    return filtered_df.drop(ROW_INDEX_COLUMN), selection_df
 
 
 def aggregate_across_samples(df):
@@ -160,41 +342,315 @@ def aggregate_across_samples(df):
     Only applies when the sampleId column is present (In Vivo Score case).
     All columns except sampleId and inVivo_primaryAbundance have identical values
     per clonotype, so grouping by them naturally deduplicates the rows.
+    Works on a DataFrame or a LazyFrame.
     """
-    if "sampleId" not in df.columns:
+    schema = df.collect_schema()
+    if "sampleId" not in schema:
         return df
 
     # Abundance may be loaded as String with "" for missing values
-    if df["inVivo_primaryAbundance"].dtype == pl.Utf8:
+    if schema["inVivo_primaryAbundance"] == pl.Utf8:
         df = df.with_columns(
             pl.col("inVivo_primaryAbundance").replace("", None).cast(pl.Int64)
         )
 
-    group_cols = [col for col in df.columns 
+    group_cols = [col for col in schema.names()
                      if col not in ("sampleId", "inVivo_primaryAbundance")]
+    if isinstance(df, pl.LazyFrame):
+        return df.group_by(group_cols).agg(pl.col("inVivo_primaryAbundance").sum()).sort("clonotypeKey")
     rows_before = df.height
     df = df.group_by(group_cols).agg(pl.col("inVivo_primaryAbundance").sum()).sort("clonotypeKey")
     print(f"Aggregated across samples: {rows_before} -> {df.height} rows (summed inVivo_primaryAbundance)")
     return df
 
 
+def prepare_table(df, filter_map):
+    """
+    Cast numeric filter columns loaded as strings, apply the primary filter and
+    collapse the sample dimension. Works on a DataFrame or a LazyFrame.
+
+    Args:
+        df: polars DataFrame or LazyFrame
+        filter_map: dictionary mapping column names to filter specifications
+
+    Returns:
+        prepared polars DataFrame or LazyFrame
+    """
+    schema = df.collect_schema()
+
+    # Make sure numeric columns where loaded as such
+    for column in filter_map.keys():
+        filter_spec = filter_map[column]
+
+        filter_type = filter_spec["type"]
+        data_type = filter_spec["valueType"]
+        # Check data type if filters are non-string and correct for the given data type 
+        if ((data_type != "String") and (filter_type.startswith("number_"))):
+
+            if filter_map[column]["type"].startswith("number_") and schema[column] == pl.String:
+                print("Data type inconsistency in column {column}. Trying to find out if it's an integer or a float...")
+                # Check if non-empty values ("") might be integers or floats
+                non_empty = df.filter(pl.col(column) != "").select(pl.col(column)).head(50)
+                if isinstance(non_empty, pl.LazyFrame):
+                    non_empty = non_empty.collect()
+                non_empty_values = non_empty.to_series().to_list()
+                consensus_type = {"interger": 0, "float": 0}
+                for value in non_empty_values:
+                    if isinstance(value, int):
+                        consensus_type["interger"] += 1
+                    elif isinstance(value, float):
+                        consensus_type["float"] += 1
+                    else:
+                        print(f"Value {value} is not an integer or float. Skipping cast.")
+                # decide data type based on consensus
+                if consensus_type["interger"] > consensus_type["float"]:
+                    dtype = pl.Int32
+                    print(f"Casting column {column} to Int64 based on consensus.")
+                else:
+                    dtype = pl.Float64
+                    print(f"Casting column {column} to Float64 based on consensus.")
+                # Most tommon case is that zero values are represented as ""
+                df = df.with_columns(pl.col(column).replace("", float("NaN")).cast(dtype))
+
+    # Optional primary filter (PlDatasetSelector): a pre-condition, not a tracked
+    # stage. The Full join keeps all clonotypes (null/empty for those outside the
+    # filter), so narrow here, before stage tracking — not via join semantics.
+    if "primary_filter" in schema:
+        primary = pl.col("primary_filter").is_not_null() & (pl.col("primary_filter").cast(pl.Utf8) != "")
+        if isinstance(df, pl.LazyFrame):
+            df = df.filter(primary)
+        else:
+            before_primary = df.height
+            df = df.filter(primary)
+            print(f"Primary filter pre-drop: {before_primary} -> {df.height} rows")
+
+    # Collapse sample dimension if present (In Vivo Score case)
+    return aggregate_across_samples(df)
+
+
+def column_summaries(df, columns):
+    """
+    Summaries of the given columns for filter and ranking previews: missing
+    count, and min/max, nearest-rank quantiles and an equal-width histogram for
+    numeric columns, or distinct count and most frequent values for the others.
+    NaN counts as missing; ±inf is counted as "infinite" for float columns and
+    left out of the distribution, so the summary stays finite (valid JSON).
+    Works on a DataFrame or a (streamed) LazyFrame, in two aggregation queries.
+
+    Args:
+        df: polars DataFrame or LazyFrame
+        columns: columns to summarize
+
+    Returns:
+        dict: {"rows": N, "columns": {column: summary}}, JSON-serializable
+    """
+    lf = df.lazy()
+    schema = lf.collect_schema()
+    engine = "streaming" if isinstance(df, pl.LazyFrame) else "auto"
+
+    def present(column):
+        values = pl.col(column)
+        return values.filter(values.is_finite()) if schema[column].is_float() else values.drop_nulls()
+
+    numeric = [column for column in columns if schema[column].is_numeric()]
+    aggregations = []
+    for column in columns:
+        missing = pl.col(column).is_null()
+        if schema[column].is_float():
+            missing = missing | pl.col(column).is_nan()
+        aggregations.append(missing.sum().alias(f"{column}:missing"))
+        if schema[column].is_float():
+            aggregations.append(pl.col(column).is_infinite().sum().alias(f"{column}:infinite"))
+        if column in numeric:
+            aggregations += [present(column).len().alias(f"{column}:present"),
+                             present(column).min().alias(f"{column}:min"),
+                             present(column).max().alias(f"{column}:max")]
+        else:
+            aggregations += [pl.col(column).drop_nulls().n_unique().alias(f"{column}:distinct"),
+                             pl.col(column).drop_nulls().value_counts(sort=True, name="count")
+                             .head(SUMMARY_TOP_CATEGORIES).implode().alias(f"{column}:top")]
+    stats = lf.select(pl.len().alias("rows"), *aggregations).collect(engine=engine).row(0, named=True)
+
+    # Quantiles and histograms need the counts and ranges from the first query
+    distributions = []
+    for column in numeric:
+        present_count = stats[f"{column}:present"]
+        if present_count == 0:
+            continue
+        low, high = stats[f"{column}:min"], stats[f"{column}:max"]
+        width = (high - low) / SUMMARY_HISTOGRAM_BINS or 1
+        ranks = [round(q * (present_count - 1)) for q in SUMMARY_QUANTILES]
+        distributions += [
+            present(column).sort().gather(ranks).implode().alias(f"{column}:quantiles"),
+            ((present(column) - low) / width).floor().clip(0, SUMMARY_HISTOGRAM_BINS - 1)
+            .cast(pl.Int32).value_counts(name="count").implode().alias(f"{column}:histogram"),
+        ]
+    if distributions:
+        distributions = lf.select(distributions).collect(engine=engine).row(0, named=True)
+
+    summaries = {}
+    for column in columns:
+        summary = {"dtype": str(schema[column]), "missing": stats[f"{column}:missing"]}
+        if schema[column].is_float():
+            summary["infinite"] = stats[f"{column}:infinite"]
+        if column in numeric:
+            summary["min"], summary["max"] = stats[f"{column}:min"], stats[f"{column}:max"]
+            if f"{column}:quantiles" in distributions:
+                summary["quantiles"] = dict(zip(map(str, SUMMARY_QUANTILES), distributions[f"{column}:quantiles"]))
+                counts = [0] * SUMMARY_HISTOGRAM_BINS
+                for entry in distributions[f"{column}:histogram"]:
+                    counts[entry[column]] = entry["count"]
+                low, high = summary["min"], summary["max"]
+                summary["histogram"] = {
+                    "edges": [low + (high - low) * i / SUMMARY_HISTOGRAM_BINS
+                              for i in range(SUMMARY_HISTOGRAM_BINS + 1)],
+                    "counts": counts,
+                }
+        else:
+            summary["distinct"] = stats[f"{column}:distinct"]
+            summary["top"] = [{"value": entry[column], "count": entry["count"]}
+                              for entry in stats[f"{column}:top"]]
+        summaries[column] = summary
+    return {"rows": stats["rows"], "columns": summaries}
+
+
+def write_column_summaries(df, path, metrics):
+    """Write column_summaries() of the table's Filter_*/Col* columns as JSON."""
+    columns = [col for col in df.collect_schema().names() if re.match(SUMMARY_COLUMN_PATTERN, col)]
+    with metrics.stage("summary") as stage:
+        summary = column_summaries(df, columns)
+        with open(path, "w") as f:
+            json.dump(summary, f, allow_nan=False)
+        stage.rows_in = summary["rows"]
+    print(f"Column summaries: {stage.wall:.3f}s ({len(columns)} columns, wrote to {path})")
+
+
+def filter_streaming(lf, filter_map, out, emit_selection, metrics):
+    """
+    Memory-bounded variant of apply_filters + output for inputs over the memory budget.
+
+    Instead of materializing the table and anti-joining keys per stage, each
+    filter becomes a boolean predicate: survivors pass all of them and a clone's
+    selection stage is the first filter it fails. Both outputs are written with
+    polars' streaming engine straight from the scan, so only batches (and the
+    sort by clonotypeKey of the output profile) are held in memory.
+
+    Args:
+        lf: prepared polars LazyFrame
+        filter_map: dictionary mapping column names to filter specifications
+        out: output Parquet path for the filtered table
+        emit_selection: output Parquet path for selection stages, or None
+        metrics: Metrics
+
+    Returns:
+        int: number of rows after filtering
+    """
+    if not filter_map:
+        print("Filter map is empty. Returning input table with 'top' column added.")
+        passes = []
+    else:
+        schema = lf.collect_schema()
+        filter_columns = sorted([col for col in schema.names() if re.match(r'^Filter_\d+$', col)],
+                                key=lambda x: int(x[7:]))
+        print(f"Found Filter_* columns: {filter_columns}")
+        print(f"Filter map keys: {list(filter_map.keys())}")
+        passes = []
+        for column_name in filter_columns:
+            filter_spec = filter_map[column_name]
+            if filter_applies(filter_spec["type"], filter_spec["valueType"]):
+                print(f"Applying filter: {column_name} {filter_spec['type']} {filter_spec.get('reference')}")
+                # filter() drops rows whose predicate is null, so null counts as failing
+                passes.append(filter_expression(column_name, filter_spec["type"], filter_spec.get("reference"),
+                                                schema[column_name]).fill_null(False))
+            else:
+                passes.append(pl.lit(True))
+
+    with metrics.stage("write") as stage:
+        filtered = lf.filter(pl.all_horizontal(passes)) if passes else lf
+        parquet_output.sink_parquet(filtered.with_columns(pl.lit(1).alias("top")), out)
+        stage.rows_out = table_io.scan_polars(out).select(pl.len()).collect().item()
+    print(f"Output: {stage.wall:.3f}s (wrote {stage.rows_out} rows to {out})")
+
+    if emit_selection:
+        # Survivors get N_filters + 1 (1 for an empty filter map, as in apply_filters)
+        stage_expr = pl.lit(len(passes) + 1)
+        for stage_idx in range(len(passes), 0, -1):
+            stage_expr = pl.when(~passes[stage_idx - 1]).then(pl.lit(stage_idx)).otherwise(stage_expr)
+        with metrics.stage("write_selection"):
+            parquet_output.sink_parquet(
+                lf.select(pl.col("clonotypeKey"), stage_expr.cast(pl.Int64).alias("selectionStage")), emit_selection)
+        print(f"filter.py:wrote selection parquet: {emit_selection}")
+    else:
+        print(f"filter.py:WARNING: --emit-selection not passed")
+
+    return stage.rows_out
+
+
 def main():
     start_time = time.time()
     print(f"filter.py:main() START at {time.strftime('%H:%M:%S')}")
 
     args = parse_arguments()
     print(f"filter.py:args: parquet={args.parquet} out={args.out} emit_selection={args.emit_selection}")
+    metrics = Metrics("filter", args.metrics_out)
+
+    # Reuse the outputs of an earlier run on the same input with the same filters
+    cache = ResultCache(args.cache_dir, args.cache_size)
+    cache_outputs = {'out': args.out}
+    if args.emit_selection:
+        cache_outputs['selection'] = args.emit_selection
+    if args.emit_summary:
+        cache_outputs['summary'] = args.emit_summary
+    input_fingerprints = cache.fingerprints([args.parquet])
+    cache_key = cache.key("filter", [args.parquet],
+                          {'filter_map': json_param(args.filter_map), 'formats': output_formats(cache_outputs)},
+                          cache_outputs, fingerprints=input_fingerprints)
+    if cache.restore(cache_key, cache_outputs):
+        print(f"filter.py:DONE in {time.time() - start_time:.3f}s")
+        return
+
+    # Estimate the eager working set from the Parquet metadata before loading
+    budget = args.memory_budget or default_memory_budget()
+    try:
+        input_rows, estimate = estimate_parquet_memory(args.parquet)
+    except Exception as e:
+        print(f"Error reading file: {e}")
+        return
+    print(f"Estimated input size: {format_size(estimate)} ({input_rows:,} rows), "
+          f"memory budget: {format_size(budget) if budget else 'unlimited'}")
+
+    if input_rows > 0 and exceeds_budget(estimate, EAGER_WORKING_SET_FACTOR, budget):
+        print(f"filter.py:eager filtering would need ~{format_size(estimate * EAGER_WORKING_SET_FACTOR)}, "
+              f"switching to streaming mode")
+        try:
+            filter_map = json.loads(args.filter_map)
+            print(f"Loaded filter map: {filter_map}")
+        except json.JSONDecodeError as e:
+            print(f"Error parsing filter map JSON: {e}")
+            return
+        metrics.rows(rows_in=input_rows)
+        with metrics.stage("prepare") as stage:
+            lf = prepare_table(table_io.scan_polars(args.parquet), filter_map)
+        if args.emit_summary:
+            write_column_summaries(lf, args.emit_summary, metrics)
+        rows_out = filter_streaming(lf, filter_map, args.out, args.emit_selection, metrics)
+        metrics.rows(rows_out=rows_out)
+        print(f"Rows after filtering: {rows_out}")
+        cache.store(cache_key, cache_outputs, time.time() - start_time)
+        print(f"filter.py:DONE in {time.time() - start_time:.3f}s")
+        return
 
     # Load Parquet file
-    load_start = time.time()
     try:
-        df = pl.read_parquet(args.parquet)
+        with metrics.stage("load") as stage:
+            df = worker.read_parquet(args.parquet, table_io.read_polars)
+            stage.rows_out = df.height
     except Exception as e:
         print(f"Error reading file: {e}")
         return
-    
-    load_time = time.time() - load_start
-    print(f"Data loading: {load_time:.3f}s ({df.height:,} rows, {len(df.columns)} columns)")
+
+    print(f"Data loading: {stage.wall:.3f}s ({df.height:,} rows, {len(df.columns)} columns)")
+    metrics.rows(rows_in=df.height)
 
     # Check if file is empty
     if df.height == 0:
@@ -203,13 +659,17 @@ def main():
             'clonotypeKey': pl.Utf8,
             'top': pl.Int64,
         })
-        empty_df.write_parquet(args.out)
+        parquet_output.write_parquet(empty_df, args.out)
         if args.emit_selection:
             empty_selection = pl.DataFrame(schema={
                 'clonotypeKey': pl.Utf8,
                 'selectionStage': pl.Int64,
             })
-            empty_selection.write_parquet(args.emit_selection)
+            parquet_output.write_parquet(empty_selection, args.emit_selection)
+        if args.emit_summary:
+            with open(args.emit_summary, "w") as f:
+                json.dump({"rows": 0, "columns": {}}, f)
+        metrics.rows(rows_out=0)
         total_time = time.time() - start_time
         print(f"Empty output file created: {args.out}")
         print(f"Total time: {total_time:.3f}s")
@@ -223,79 +683,43 @@ def main():
         print(f"Error parsing filter map JSON: {e}")
         return
 
-    # Make sure numeric columns where loaded as such
-    for column in filter_map.keys():
-        filter_spec = filter_map[column]
-        
-        filter_type = filter_spec["type"]
-        data_type = filter_spec["valueType"]
-        # Check data type if filters are non-string and correct for the given data type 
-        if ((data_type != "String") and (filter_type.startswith("number_"))):
-            
-            if filter_map[column]["type"].startswith("number_") and df.schema[column] == pl.String:
-                print("Data type inconsistency in column {column}. Trying to find out if it's an integer or a float...")
-                # Check if non-empty values ("") might be integers or floats
-                non_empty_values = df.filter(pl.col(column) != "").select(pl.col(column)).to_series().to_list()
-                consensus_type = {"interger": 0, "float": 0}
-                for value in non_empty_values[:50]:
-                    if isinstance(value, int):
-                        consensus_type["interger"] += 1
-                    elif isinstance(value, float):
-                        consensus_type["float"] += 1
-                    else:
-                        print(f"Value {value} is not an integer or float. Skipping cast.")
-                # decide data type based on consensus
-                if consensus_type["interger"] > consensus_type["float"]:
-                    dtype = pl.Int32
-                    print(f"Casting column {column} to Int64 based on consensus.")
-                else:
-                    dtype = pl.Float64
-                    print(f"Casting column {column} to Float64 based on consensus.")
-                # Most tommon case is that zero values are represented as ""
-                df = df.with_columns(pl.col(column).replace("", float("NaN")).cast(dtype))
-
-    # Optional primary filter (PlDatasetSelector): a pre-condition, not a tracked
-    # stage. The Full join keeps all clonotypes (null/empty for those outside the
-    # filter), so narrow here, before stage tracking — not via join semantics.
-    if "primary_filter" in df.columns:
-        before_primary = df.height
-        df = df.filter(
-            pl.col("primary_filter").is_not_null()
-            & (pl.col("primary_filter").cast(pl.Utf8) != "")
-        )
-        print(f"Primary filter pre-drop: {before_primary} -> {df.height} rows")
-
-    # Collapse sample dimension if present (In Vivo Score case)
-    df = aggregate_across_samples(df)
+    with metrics.stage("prepare", rows_in=df.height) as stage:
+        df = prepare_table(df, filter_map)
+        stage.rows_out = df.height
+    if args.emit_summary:
+        write_column_summaries(df, args.emit_summary, metrics)
 
     # Apply filters
-    filtering_start = time.time()
     print(f"Initial rows: {df.height}")
-    filtered_df, selection_df = apply_filters(df, filter_map)
-    filtering_time = time.time() - filtering_start
+    with metrics.stage("filter", rows_in=df.height) as stage:
+        checkpoints = StageCheckpoints(cache, args.parquet, df.height, input_fingerprints)
+        filtered_df, selection_df = apply_filters(df, filter_map, metrics, checkpoints)
+        stage.rows_out = filtered_df.height
     print(f"Rows after filtering: {filtered_df.height}")
-    print(f"Filtering: {filtering_time:.3f}s")
+    print(f"Filtering: {stage.wall:.3f}s")
 
     # Add a column named top with value 1
     filtered_df = filtered_df.with_columns(pl.lit(1).alias("top"))
 
     # Output filtered data to parquet
-    output_start = time.time()
     if filtered_df.height == 0:
         print("Warning: No rows remain after filtering. Creating empty output file.")
 
-    filtered_df.write_parquet(args.out)
-    output_time = time.time() - output_start
-    print(f"Output: {output_time:.3f}s (wrote to {args.out})")
+    with metrics.stage("write", rows_in=filtered_df.height) as stage:
+        parquet_output.write_parquet(filtered_df, args.out)
+    print(f"Output: {stage.wall:.3f}s (wrote to {args.out})")
+    metrics.rows(rows_out=filtered_df.height)
 
     # Write selection stage data if requested
     if args.emit_selection:
         print(f"filter.py:writing selection parquet: schema={selection_df.schema} rows={selection_df.height}")
-        selection_df.write_parquet(args.emit_selection)
+        with metrics.stage("write_selection", rows_in=selection_df.height):
+            parquet_output.write_parquet(selection_df, args.emit_selection)
         print(f"filter.py:wrote selection parquet: {args.emit_selection}")
     else:
         print(f"filter.py:WARNING: --emit-selection not passed")
 
+    cache.store(cache_key, cache_outputs, time.time() - start_time)
     total_time = time.time() - start_time
     print(f"filter.py:DONE in {total_time:.3f}s")
 
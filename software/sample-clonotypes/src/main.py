@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 
 import argparse
+import numpy as np
 import polars as pl
 import re
 import os
 import time
 import json
 
+from memory_budget import (default_memory_budget, estimate_parquet_memory, exceeds_budget, format_size,
+                           parse_memory_size)
+from metrics import Metrics
+import parquet_output
+import table_io
+from result_cache import DEFAULT_CACHE_SIZE, ResultCache, json_param, output_formats
+import worker
 
 
 # In Vivo Score: source column headers and composite weights
@@ -16,6 +24,20 @@ IN_VIVO_SCORE_SOURCES = {
     "inVivo_nMutations": 0.25,
 }
 
+# Peak memory of the eager path relative to the decoded input table (the table
+# plus its sorted copies)
+EAGER_WORKING_SET_FACTOR = 3
+# Columns read from the input for ranking when the full table is over budget
+RANKING_COLUMN_PATTERN = r'^(clonotypeKey|Col\d+|Col_cluster\.\d+|Col_linker\.\d+(?:\.\d+)?)$'
+
+# Similarity diversification: MinHash signature length, hash seed, default
+# k-mer length and Jaccard threshold, and candidates sketched per block
+MINHASH_PERMUTATIONS = 64
+MINHASH_SEED = 42
+DEFAULT_SIMILARITY_KMER = 3
+DEFAULT_SIMILARITY_THRESHOLD = 0.7
+SIMILARITY_BLOCK_ROWS = 50_000
+
 
 def compute_in_vivo_score(df):
     """Compute In Vivo Score: weighted percentile combination of primary abundance,
@@ -51,18 +73,53 @@ def compute_in_vivo_score(df):
     return df
 
 
+def jaccard_threshold(text):
+    """argparse type of --similarity-threshold: a Jaccard similarity in (0, 1]."""
+    value = float(text)
+    if not 0 < value <= 1:
+        raise argparse.ArgumentTypeError(f"must be in (0, 1], got {text}")
+    return value
+
+
+def positive_int(text):
+    """argparse type of an integer >= 1."""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be >= 1, got {text}")
+    return value
+
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Rank rows based on Col* columns and output top N rows. Supports Col0, Col1 (clonotype properties), Col_cluster.0 (cluster properties), and Col_linker.0.0, Col_linker.0.1 (linker properties).")
-    parser.add_argument("--parquet", required=True, help="Path to input Parquet file")
+    parser.add_argument("--parquet", required=True, help="Path to input Parquet (or Arrow IPC) file")
     parser.add_argument("--n", type=int, required=True, help="Number of top rows to output")
-    parser.add_argument("--out", required=True, help="Path to output Parquet file")
+    parser.add_argument("--out", required=True, help="Path to output Parquet file (Arrow IPC for a .arrow name)")
     parser.add_argument("--ranking-map", type=str, help='JSON string specifying ranking direction for each column, e.g., {"Col0":"decreasing","Col1":"increasing","Col_linker.0.0":"decreasing"}')
     parser.add_argument("--diversification-column", type=str,
                         help="Column header name to use for diversified ranking (e.g., 'clusterAxis_0_0')")
+    parser.add_argument("--similarity-columns", type=str, required=False,
+                        help="Comma-separated sequence columns (e.g., CDR3 of each chain) for similarity "
+                             "diversification: clonotypes similar to a better-ranked selected one are skipped")
+    parser.add_argument("--similarity-threshold", type=jaccard_threshold, default=DEFAULT_SIMILARITY_THRESHOLD,
+                        help=f"Estimated k-mer Jaccard similarity at or above which a clonotype counts as a "
+                             f"near-duplicate (default: {DEFAULT_SIMILARITY_THRESHOLD})")
+    parser.add_argument("--similarity-kmer", type=positive_int, default=DEFAULT_SIMILARITY_KMER,
+                        help=f"k-mer length of the sequence sketches (default: {DEFAULT_SIMILARITY_KMER})")
     parser.add_argument("--selection-in", type=str, required=False,
                         help="Path to selection stage parquet from filter.py (clonotypeKey + selectionStage)")
     parser.add_argument("--selection-out", type=str, required=False,
                         help="Path to write updated selection stage parquet (sampled clones get bumped stage)")
+    parser.add_argument("--metrics-out", type=str, required=False,
+                        help="Append per-stage metrics (JSON lines) to this file")
+    parser.add_argument("--memory-budget", type=parse_memory_size, required=False,
+                        help="Memory available to the tool, e.g. 16GiB (default: 80%% of the container limit); "
+                             "inputs that would not fit are read with only the ranking columns, and plain ranking keeps "
+                             "only the top N rows if even those would not fit")
+    parser.add_argument("--cache-dir", type=str, required=False,
+                        help="Reuse outputs of earlier runs with the same inputs and ranking settings from this "
+                             "directory (default: $TOP_ANTIBODIES_CACHE_DIR; no caching if unset)")
+    parser.add_argument("--cache-size", type=parse_memory_size, default=DEFAULT_CACHE_SIZE,
+                        help=f"Size limit of the result cache (default: {DEFAULT_CACHE_SIZE})")
     return parser.parse_args()
 
 
@@ -98,6 +155,40 @@ def parse_ranking_map(ranking_map_str, all_col_columns):
     return complete_map
 
 
+def ranking_input_columns(columns, diversification_column=None, similarity_columns=()):
+    """
+    Input columns main() actually uses: clonotypeKey, the Col* ranking columns,
+    the diversification and similarity columns and the In Vivo Score sources.
+
+    Args:
+        columns: input column names
+        diversification_column: diversification column name, or None
+        similarity_columns: sequence columns for similarity diversification
+
+    Returns:
+        list of column names, in input order
+    """
+    return [col for col in columns
+            if re.match(RANKING_COLUMN_PATTERN, col)
+            or col == diversification_column
+            or col in similarity_columns
+            or col in IN_VIVO_SCORE_SOURCES]
+
+
+def ranking_column_groups(columns):
+    """
+    Clonotype (Col0, Col1, ...), cluster (Col_cluster.0, ...) and linker
+    (Col_linker.0, Col_linker.0.0, ...) ranking columns, each in index order.
+    """
+    clonotype_col_columns = sorted([col for col in columns if re.match(r'^Col\d+$', col)],
+                                   key=lambda x: int(x[3:]))
+    cluster_col_columns = sorted([col for col in columns if re.match(r'^Col_cluster\.\d+$', col)],
+                                 key=lambda x: int(x.split('.')[1]))
+    linker_col_columns = sorted([col for col in columns if re.match(r'^Col_linker\.\d+(?:\.\d+)?$', col)],
+                                key=lambda x: tuple(map(int, x.split('.')[1:])))
+    return clonotype_col_columns, cluster_col_columns, linker_col_columns
+
+
 def validate_column_format(df):
     print("Found columns:", df.columns)
 
@@ -106,25 +197,134 @@ def validate_column_format(df):
         print("Error: Input CSV must contain a 'clonotypeKey' column.")
         return False
 
-    # Check for clonotype ranking columns (Col0, Col1, ...)
-    clonotype_col_columns = sorted([col for col in df.columns if re.match(r'^Col\d+$', col)],
-                                   key=lambda x: int(x[3:]))
+    clonotype_col_columns, cluster_col_columns, linker_col_columns = ranking_column_groups(df.columns)
     print("Found clonotype ranking columns:", clonotype_col_columns)
-
-    # Check for cluster ranking columns (Col_cluster.0, Col_cluster.1, ...)
-    cluster_col_columns = sorted([col for col in df.columns if re.match(r'^Col_cluster\.\d+$', col)],
-                                 key=lambda x: int(x.split('.')[1]))
     print("Found cluster ranking columns:", cluster_col_columns)
-
-    # Check for linker ranking columns (Col_linker.0, Col_linker.0.0, Col_linker.0.1, etc.)
-    linker_col_columns = sorted([col for col in df.columns if re.match(r'^Col_linker\.\d+(?:\.\d+)?$', col)],
-                                key=lambda x: tuple(map(int, x.split('.')[1:])))
     print("Found linker ranking columns:", linker_col_columns)
 
     return clonotype_col_columns, cluster_col_columns, linker_col_columns
 
 
-def diversified_rank_and_select(df, n, ranking_map, all_ranking_cols, diversification_column=None):
+def minhash_signatures(sequences, kmer):
+    """
+    MinHash signatures of the k-mer sets of sequences.
+
+    Each k-mer is hashed once; the MINHASH_PERMUTATIONS hash functions are
+    odd-multiplier affine maps of that hash (bijections of uint64), and a
+    signature holds the minimum of each over the sequence's k-mers. Sequences
+    shorter than kmer are a single shingle.
+
+    Args:
+        sequences: polars String Series
+        kmer: k-mer length
+
+    Returns:
+        numpy uint64 array of shape (len(sequences), MINHASH_PERMUTATIONS)
+    """
+    rng = np.random.default_rng(MINHASH_SEED)
+    multipliers = rng.integers(1, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+    kmers = (pl.DataFrame({"sequence": sequences.fill_null("")})
+             .with_row_index("row")
+             .with_columns(pl.int_ranges(0, pl.max_horizontal(pl.col("sequence").str.len_chars().cast(pl.Int64) - kmer + 1, 1))
+                           .alias("start"))
+             .explode("start")
+             .select("row", pl.col("sequence").str.slice(pl.col("start"), kmer).hash(MINHASH_SEED).alias("hash")))
+    rows = kmers["row"].to_numpy()
+    hashes = kmers["hash"].to_numpy()
+    # Each sequence's k-mers are contiguous after explode
+    boundaries = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+
+    signatures = np.empty((len(sequences), MINHASH_PERMUTATIONS), dtype=np.uint64)
+    for i in range(MINHASH_PERMUTATIONS):
+        signatures[:, i] = np.minimum.reduceat(hashes * multipliers[i] + offsets[i], boundaries)
+    return signatures
+
+
+def lsh_bands(threshold):
+    """
+    LSH banding (bands, rows per band) of the MinHash signature for a similarity threshold.
+
+    Picks the banding whose S-curve midpoint (1/bands)^(1/rows) is the highest
+    one not above the threshold, so pairs at the threshold are found with high
+    probability and candidate pairs are then checked against the threshold.
+    """
+    options = [(bands, MINHASH_PERMUTATIONS // bands) for bands in range(1, MINHASH_PERMUTATIONS + 1)
+               if MINHASH_PERMUTATIONS % bands == 0]
+    midpoint = lambda option: (1 / option[0]) ** (1 / option[1])
+    below = [option for option in options if midpoint(option) <= threshold]
+    return max(below, key=midpoint) if below else min(options, key=midpoint)
+
+
+def similarity_diversified_head(df, n, similarity_columns, threshold, kmer):
+    """
+    First n rows of df (in its order) that are not near-duplicates of an earlier selected row.
+
+    Rows are sketched with MinHash over the k-mers of their sequence columns
+    (joined with "|", a null column counting as empty) and bucketed per LSH band;
+    a row is skipped when a selected row sharing a bucket has estimated Jaccard
+    similarity >= threshold. Rows without any sequence are never skipped.
+    Rows are sketched in blocks of SIMILARITY_BLOCK_ROWS until n are selected,
+    so the cost is linear in the rows consumed and no pairs outside shared
+    buckets are compared.
+
+    Args:
+        df: polars DataFrame in ranking order
+        n: number of rows to select
+        similarity_columns: sequence columns
+        threshold: Jaccard similarity threshold
+        kmer: k-mer length
+
+    Returns:
+        polars DataFrame of the selected rows, in df order
+    """
+    bands, rows_per_band = lsh_bands(threshold)
+    print(f"Similarity diversification on {similarity_columns}: {kmer}-mers, Jaccard >= {threshold}, "
+          f"{bands} LSH bands x {rows_per_band} rows")
+    min_equal = threshold * MINHASH_PERMUTATIONS
+    band_mix = np.random.default_rng(MINHASH_SEED + 1).integers(
+        1, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+
+    sequences = df.select(
+        pl.concat_str([pl.col(col).fill_null("") for col in similarity_columns], separator="|")).to_series()
+    no_sequence = df.select(
+        pl.all_horizontal([pl.col(col).fill_null("") == "" for col in similarity_columns])).to_series().to_numpy()
+    buckets = [{} for _ in range(bands)]
+    selected_rows = []
+    # Signatures of the selected rows, grown by doubling
+    selected_signatures = np.empty((min(n, SIMILARITY_BLOCK_ROWS), MINHASH_PERMUTATIONS), dtype=np.uint64)
+    skipped = 0
+    for start in range(0, df.height, SIMILARITY_BLOCK_ROWS):
+        signatures = minhash_signatures(sequences.slice(start, SIMILARITY_BLOCK_ROWS), kmer)
+        band_keys = (signatures * band_mix).reshape(-1, bands, rows_per_band).sum(axis=2).tolist()
+        for i, keys in enumerate(band_keys):
+            signature = signatures[i]
+            if no_sequence[start + i]:
+                keys = ()  # selected, but never a near-duplicate of (or bucketed with) other rows
+            elif any(np.count_nonzero(selected_signatures[j] == signature) >= min_equal
+                   for band, key in enumerate(keys) for j in buckets[band].get(key, ())):
+                skipped += 1
+                continue
+
+            selected = len(selected_rows)
+            for band, key in enumerate(keys):
+                buckets[band].setdefault(key, []).append(selected)
+            if selected == len(selected_signatures):
+                selected_signatures = np.concatenate([selected_signatures, np.empty_like(selected_signatures)])
+            selected_signatures[selected] = signature
+            selected_rows.append(start + i)
+            if len(selected_rows) == n:
+                break
+        if len(selected_rows) == n:
+            break
+    print(f"Skipped {skipped} near-duplicate clonotypes")
+    return df[selected_rows]
+
+
+def diversified_rank_and_select(df, n, ranking_map, all_ranking_cols, diversification_column=None,
+                                similarity_columns=None, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                                similarity_kmer=DEFAULT_SIMILARITY_KMER):
     """
     Rank and select top N rows using diversified ranking.
 
@@ -133,7 +333,8 @@ def diversified_rank_and_select(df, n, ranking_map, all_ranking_cols, diversific
     2. If diversification_column is set:
        a. Compute _local_rank = cumulative count within each group (preserves sort order)
        b. Re-sort by (_local_rank ASC, ranking criteria)
-    3. Take top N
+    3. Take top N; with similarity_columns, skip rows whose sequences are
+       near-duplicates of a row already taken (similarity_diversified_head)
     4. Add ranked_order column
     """
     # Convert ranking columns to numeric types if they're strings
@@ -187,17 +388,14 @@ def diversified_rank_and_select(df, n, ranking_map, all_ranking_cols, diversific
         # Re-sort by (_local_rank ASC, ranking criteria)
         final_sort_columns = ["_local_rank"] + sort_columns
         final_sort_descending = [False] + sort_descending
-        df = df.sort(final_sort_columns, descending=final_sort_descending)
-
-        # Take top N
-        result = df.head(n)
+        df = df.sort(final_sort_columns, descending=final_sort_descending).drop("_local_rank")
+    elif diversification_column:
+        print(f"Warning: Diversification column '{diversification_column}' not found in data. Skipping diversification.")
 
-        # Drop _local_rank
-        result = result.drop("_local_rank")
+    # Step 3: Take top N
+    if similarity_columns:
+        result = similarity_diversified_head(df, n, similarity_columns, similarity_threshold, similarity_kmer)
     else:
-        if diversification_column:
-            print(f"Warning: Diversification column '{diversification_column}' not found in data. Skipping diversification.")
-        # No diversification: plain sort, take top N
         result = df.head(n)
 
     # Add ranked_order column
@@ -205,6 +403,31 @@ def diversified_rank_and_select(df, n, ranking_map, all_ranking_cols, diversific
     return result
 
 
+def streaming_top_n(lf, n, ranking_map, all_ranking_cols):
+    """
+    Top N rows of a table too large for memory, by the ranking of
+    diversified_rank_and_select without diversification, computed with the
+    streaming engine (only the N best rows are kept at any time).
+
+    Args:
+        lf: polars LazyFrame with clonotypeKey and the ranking columns
+        n: number of rows to keep
+        ranking_map: ranking direction of each column in all_ranking_cols
+        all_ranking_cols: ranking columns in priority order
+
+    Returns:
+        polars DataFrame of at most n rows, in no particular order
+    """
+    schema = lf.collect_schema()
+    lf = lf.with_columns([pl.col(col).cast(pl.Float64) for col in all_ranking_cols if schema[col] == pl.Utf8])
+    if all_ranking_cols:
+        lf = lf.drop_nulls(subset=all_ranking_cols)
+    # top_k keeps the largest values; reverse selects the smallest for increasing columns
+    return lf.top_k(n, by=all_ranking_cols + ['clonotypeKey'],
+                    reverse=[ranking_map[col] == "increasing" for col in all_ranking_cols] + [True]
+                    ).collect(engine="streaming")
+
+
 def main():
     start_time = time.time()
     print(f"main.py:START at {time.strftime('%H:%M:%S')}")
@@ -212,34 +435,99 @@ def main():
     print(f"main.py:args: parquet={args.parquet} out={args.out} selection_in={args.selection_in} selection_out={args.selection_out}")
     # Handle deprecated flags: map old args to new diversification-column
     diversification_column = args.diversification_column
+    similarity_columns = ([col.strip() for col in args.similarity_columns.split(",") if col.strip()]
+                          if args.similarity_columns else [])
+    metrics = Metrics("sample", args.metrics_out)
+
+    # Reuse the outputs of an earlier run on the same inputs with the same ranking settings
+    update_selection = bool(args.selection_in and args.selection_out)
+    cache = ResultCache(args.cache_dir, args.cache_size)
+    cache_outputs = {'out': args.out}
+    if update_selection:
+        cache_outputs['selection'] = args.selection_out
+    cache_key = cache.key(
+        "sample",
+        [args.parquet, args.selection_in if update_selection else None],
+        {'n': args.n, 'ranking_map': json_param(args.ranking_map), 'diversification_column': diversification_column,
+         'similarity': [similarity_columns, args.similarity_threshold, args.similarity_kmer]
+         if similarity_columns else None,
+         'formats': output_formats(cache_outputs)},
+        cache_outputs)
+    if cache.restore(cache_key, cache_outputs):
+        print(f"main.py:DONE in {time.time() - start_time:.3f}s")
+        return
+
+    if args.n <= 0:
+        print("Error: N must be a positive integer.")
+        return
 
-    # Load Parquet file
-    load_start = time.time()
+    # Load Parquet file; if the eager working set would not fit the memory
+    # budget, read only the columns ranking needs with the streaming engine, and
+    # if even those would not fit, keep only the top N rows while streaming
+    budget = args.memory_budget or default_memory_budget()
     try:
-        df = pl.read_parquet(args.parquet)
+        with metrics.stage("load") as stage:
+            # A table already decoded in the worker's memory needs no estimate
+            cached = worker.is_cached(args.parquet, table_io.read_polars)
+            if not cached:
+                input_rows, estimate = estimate_parquet_memory(args.parquet)
+                print(f"Estimated input size: {format_size(estimate)} ({input_rows:,} rows), "
+                      f"memory budget: {format_size(budget) if budget else 'unlimited'}")
+            if cached or not exceeds_budget(estimate, EAGER_WORKING_SET_FACTOR, budget):
+                df = worker.read_parquet(args.parquet, table_io.read_polars)
+                input_rows = df.height
+            else:
+                lf = table_io.scan_polars(args.parquet)
+                columns = ranking_input_columns(lf.collect_schema().names(), diversification_column,
+                                                similarity_columns)
+                _, ranking_estimate = estimate_parquet_memory(args.parquet, columns)
+                print(f"main.py:eager load would need ~{format_size(estimate * EAGER_WORKING_SET_FACTOR)}, "
+                      f"reading only {len(columns)} ranking columns (~{format_size(ranking_estimate)})")
+                if not exceeds_budget(ranking_estimate, EAGER_WORKING_SET_FACTOR, budget):
+                    df = lf.select(columns).collect(engine="streaming")
+                else:
+                    # Plain ranking only needs the top N rows; diversification,
+                    # similarity and the In Vivo Score percentiles need all of them
+                    clonotype_col_columns, cluster_col_columns, linker_col_columns = ranking_column_groups(columns)
+                    all_ranking_cols = cluster_col_columns + linker_col_columns + clonotype_col_columns
+                    ranking_map = parse_ranking_map(args.ranking_map, all_ranking_cols)
+                    if ranking_map is None:
+                        print("Error: Invalid ranking-map provided. Exiting.")
+                        return
+                    if (diversification_column or similarity_columns or
+                            (args.ranking_map and "inVivoScore" in json.loads(args.ranking_map))):
+                        print(f"Error: the ranking columns alone need ~"
+                              f"{format_size(ranking_estimate * EAGER_WORKING_SET_FACTOR)}, over the memory budget "
+                              f"of {format_size(budget)}; diversified, similarity and In Vivo Score ranking need "
+                              f"them in memory. Raise --memory-budget or rank without them.")
+                        return
+                    print(f"main.py:ranking columns alone exceed the memory budget, "
+                          f"keeping only the top {args.n} rows while streaming")
+                    df = streaming_top_n(lf.select(columns), args.n, ranking_map, all_ranking_cols)
+            stage.rows_out = df.height
     except Exception as e:
         print(f"Error reading file: {e}")
         return
 
-    load_time = time.time() - load_start
-    print(f"Data loading: {load_time:.3f}s ({df.height:,} rows, {len(df.columns)} columns)")
+    print(f"Data loading: {stage.wall:.3f}s ({df.height:,} rows, {len(df.columns)} columns)")
+    metrics.rows(rows_in=input_rows)
 
     # Validate N
-    if args.n <= 0:
-        print("Error: N must be a positive integer.")
+    if args.n > input_rows:
+        print(f"Error: N ({args.n}) is greater than the number of rows in the table ({input_rows}).")
+        args.n = input_rows
+    missing_similarity_columns = [col for col in similarity_columns if col not in df.columns]
+    if missing_similarity_columns:
+        print(f"Error: similarity columns {missing_similarity_columns} not found in the table.")
         return
-    if args.n > df.height:
-        print(f"Error: N ({args.n}) is greater than the number of rows in the table ({df.height}).")
-        args.n = df.height
 
     # Validate columns
-    validation_start = time.time()
-    clonotype_col_columns, cluster_col_columns, linker_col_columns = validate_column_format(df)
-    validation_time = time.time() - validation_start
+    with metrics.stage("validate", rows_in=df.height) as stage:
+        clonotype_col_columns, cluster_col_columns, linker_col_columns = validate_column_format(df)
 
     all_ranking_cols = cluster_col_columns + linker_col_columns + clonotype_col_columns
     total_ranking_cols = len(all_ranking_cols)
-    print(f"Validation: {validation_time:.3f}s")
+    print(f"Validation: {stage.wall:.3f}s")
     print(f"  Found {total_ranking_cols} ranking columns " +
           f"({len(clonotype_col_columns)} clonotype, {len(cluster_col_columns)} cluster, " +
           f"{len(linker_col_columns)} linker)")
@@ -263,50 +551,54 @@ def main():
         return
 
     # Rank and select
-    ranking_start = time.time()
     if not all_ranking_cols:
         print("WARNING: No ranking columns provided, selection will be done in table order")
 
-    result = diversified_rank_and_select(df, args.n, ranking_map, all_ranking_cols, diversification_column)
-    ranking_time = time.time() - ranking_start
-    print(f"Ranking + selection: {ranking_time:.3f}s (selected {result.height} clonotypes)")
+    with metrics.stage("rank", rows_in=df.height) as stage:
+        result = diversified_rank_and_select(df, args.n, ranking_map, all_ranking_cols, diversification_column,
+                                             similarity_columns, args.similarity_threshold, args.similarity_kmer)
+        stage.rows_out = result.height
+    print(f"Ranking + selection: {stage.wall:.3f}s (selected {result.height} clonotypes)")
 
     # Create and output simplified version with top clonotypes only
-    output_start = time.time()
-    output_columns = {}
-    if diversification_column and diversification_column in df.columns:
-        output_columns[diversification_column] = result[diversification_column]
-    output_columns['clonotypeKey'] = result['clonotypeKey']
-    output_columns['top'] = [1] * result.height
-    output_columns['ranked_order'] = result['ranked_order']
-    if 'inVivoScore' in result.columns:
-        output_columns['inVivoScore'] = result['inVivoScore']
-
-    simplified_df = pl.DataFrame(output_columns)
-
-    # Output simplified version to main output file
-    simplified_df.write_parquet(args.out)
-    output_time = time.time() - output_start
-    print(f"Output: {output_time:.3f}s (wrote to {args.out})")
+    with metrics.stage("write", rows_in=result.height) as stage:
+        output_columns = {}
+        if diversification_column and diversification_column in df.columns:
+            output_columns[diversification_column] = result[diversification_column]
+        output_columns['clonotypeKey'] = result['clonotypeKey']
+        output_columns['top'] = [1] * result.height
+        output_columns['ranked_order'] = result['ranked_order']
+        if 'inVivoScore' in result.columns:
+            output_columns['inVivoScore'] = result['inVivoScore']
+
+        simplified_df = pl.DataFrame(output_columns)
+
+        # Output simplified version to main output file
+        parquet_output.write_parquet(simplified_df, args.out)
+    print(f"Output: {stage.wall:.3f}s (wrote to {args.out})")
+    metrics.rows(rows_out=result.height)
 
     # Update selection stage data: bump sampled clones to a new final stage
-    if args.selection_in and args.selection_out:
-        selection = pl.read_parquet(args.selection_in)
-        print(f"main.py:read selection_in: schema={selection.schema} rows={selection.height}")
-        sampled_keys = result.select("clonotypeKey")
-        max_stage = selection["selectionStage"].max() or 0
-        selection = selection.with_columns(
-            pl.when(pl.col("clonotypeKey").is_in(sampled_keys["clonotypeKey"]))
-            .then(pl.lit(max_stage + 1).cast(pl.Int64))
-            .otherwise(pl.col("selectionStage"))
-            .alias("selectionStage")
-        )
-        print(f"main.py:writing selection_out: schema={selection.schema} rows={selection.height}")
-        selection.write_parquet(args.selection_out)
+    if update_selection:
+        with metrics.stage("update_selection") as stage:
+            selection = table_io.read_polars(args.selection_in)
+            print(f"main.py:read selection_in: schema={selection.schema} rows={selection.height}")
+            sampled_keys = result.select("clonotypeKey")
+            max_stage = selection["selectionStage"].max() or 0
+            selection = selection.with_columns(
+                pl.when(pl.col("clonotypeKey").is_in(sampled_keys["clonotypeKey"]))
+                .then(pl.lit(max_stage + 1).cast(pl.Int64))
+                .otherwise(pl.col("selectionStage"))
+                .alias("selectionStage")
+            )
+            print(f"main.py:writing selection_out: schema={selection.schema} rows={selection.height}")
+            parquet_output.write_parquet(selection, args.selection_out)
+            stage.rows_in = stage.rows_out = selection.height
         print(f"main.py:wrote selection_out: bumped {sampled_keys.height} sampled clones to stage {max_stage + 1}")
     else:
         print(f"main.py:WARNING: --selection-in/--selection-out not both set")
 
+    cache.store(cache_key, cache_outputs, time.time() - start_time)
     total_time = time.time() - start_time
     print(f"main.py:DONE in {total_time:.3f}s")
 
@@ -0,0 +1,146 @@
+"""
+Memory budget for the block's table tools.
+
+Tools accept ``--memory-budget`` (e.g. ``16GiB``; default: the container
+memory limit) and, before loading a Parquet input, estimate how much memory the
+eager path would need from the file's metadata: the row count from the footer
+times the in-memory size per row of the projected columns, measured on a small
+sample of leading rows. When the estimate times the tool's working-set factor
+exceeds the budget, the tool switches to its lazy/streaming or chunked path.
+Arrow IPC inputs (see table_io) are estimated the same way.
+
+Works with polars or pyarrow, whichever the tool ships with. This module is
+copied verbatim into every tool's src/ that uses it (each tool is packaged from
+its own src/ root); keep the copies identical.
+"""
+
+import os
+import re
+
+from table_io import is_ipc, scan_polars
+
+# Fraction of the container limit available to the tool's data; the rest is
+# interpreter, libraries and allocator slack
+DEFAULT_BUDGET_FRACTION = 0.8
+# Leading rows decoded to measure the per-row in-memory size
+ESTIMATE_SAMPLE_ROWS = 10_000
+# cgroup v2 and v1 memory limit files
+CGROUP_LIMIT_FILES = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+# cgroup v1 reports "no limit" as a huge page-aligned number
+UNLIMITED_THRESHOLD = 1 << 60
+
+_SIZE_UNITS = {
+    '': 1, 'b': 1,
+    'k': 1000, 'kb': 1000, 'ki': 1024, 'kib': 1024,
+    'm': 1000 ** 2, 'mb': 1000 ** 2, 'mi': 1024 ** 2, 'mib': 1024 ** 2,
+    'g': 1000 ** 3, 'gb': 1000 ** 3, 'gi': 1024 ** 3, 'gib': 1024 ** 3,
+    't': 1000 ** 4, 'tb': 1000 ** 4, 'ti': 1024 ** 4, 'tib': 1024 ** 4,
+}
+
+
+def parse_memory_size(text):
+    """
+    Parse a memory size such as ``16GiB``, ``512M`` or ``1073741824``.
+
+    Suitable as an argparse ``type``.
+
+    Returns:
+        int: size in bytes
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*', str(text))
+    if not match or match.group(2).lower() not in _SIZE_UNITS:
+        raise ValueError(f"invalid memory size '{text}' (expected e.g. 16GiB, 512M or a number of bytes)")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def container_memory_limit():
+    """
+    Memory limit of the current container (cgroup), else physical memory.
+
+    Returns:
+        int | None: limit in bytes, or None if it cannot be determined
+    """
+    for path in CGROUP_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < UNLIMITED_THRESHOLD:
+            return int(value)
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_memory_budget():
+    """Memory budget used when --memory-budget is not given, in bytes (None if unknown)."""
+    limit = container_memory_limit()
+    return int(limit * DEFAULT_BUDGET_FRACTION) if limit else None
+
+
+def estimate_parquet_memory(path, columns=None, sample_rows=ESTIMATE_SAMPLE_ROWS):
+    """
+    Estimate the in-memory size of a Parquet or Arrow IPC file (or some of its columns) without loading it.
+
+    Args:
+        path: Parquet or Arrow IPC file
+        columns: columns to estimate for (default: all)
+        sample_rows: leading rows decoded to measure the per-row size
+
+    Returns:
+        tuple: (row count, estimated bytes)
+    """
+    try:
+        import polars as pl
+    except ImportError:
+        pl = None
+
+    if pl is not None:
+        lf = scan_polars(path)
+        rows = lf.select(pl.len()).collect().item()
+        if columns is not None:
+            lf = lf.select(columns)
+        sample = lf.head(sample_rows).collect()
+        sample_rows, sample_bytes = sample.height, sample.estimated_size()
+    elif is_ipc(path):
+        import pyarrow.feather as feather
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        rows = table.num_rows
+        sample_rows = min(sample_rows, rows)
+        sample_bytes = table.slice(0, sample_rows).nbytes
+    else:
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        rows = parquet_file.metadata.num_rows
+        batch = next(parquet_file.iter_batches(batch_size=sample_rows, columns=columns), None)
+        sample_rows, sample_bytes = (batch.num_rows, batch.nbytes) if batch is not None else (0, 0)
+
+    if sample_rows == 0:
+        return rows, 0
+    return rows, int(sample_bytes / sample_rows * rows)
+
+
+def exceeds_budget(estimate, working_set_factor, budget):
+    """
+    Whether the eager path's working set (estimate x factor) is over budget.
+
+    Args:
+        estimate: estimated table size in bytes
+        working_set_factor: peak memory of the eager path relative to the table size
+        budget: memory budget in bytes, or None for no budget
+
+    Returns:
+        bool
+    """
+    return budget is not None and estimate * working_set_factor > budget
+
+
+def format_size(size):
+    """Human-readable byte size for log lines."""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TiB"
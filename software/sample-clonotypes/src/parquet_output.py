@@ -0,0 +1,55 @@
+"""
+Parquet writer profile for the tools' table outputs.
+
+Outputs are sorted by clonotypeKey and written with min/max statistics,
+zstd compression and row groups of ROW_GROUP_ROWS rows. Readers looking up
+clonotypes can then skip row groups by their key range (polars does for
+``scan_parquet(...).filter(...)``, pyarrow for ``read_table(filters=...)``)
+and join against the file in key order instead of hashing all of it. Polars
+does not write Parquet's sorting_columns, so the sort key is recorded in the
+file's key-value metadata under SORTED_BY_METADATA_KEY.
+
+Tables without a clonotypeKey column are written unsorted, without the
+metadata entry. Paths with an Arrow IPC extension (see table_io) are written
+sorted as uncompressed Arrow IPC instead, for reading memory-mapped by the
+next tool.
+"""
+
+from table_io import is_ipc
+
+SORT_KEY = "clonotypeKey"
+# Small enough that a key lookup decodes few rows, large enough to keep the
+# footer (one statistics entry per row group and column) small
+ROW_GROUP_ROWS = 64 * 1024
+COMPRESSION = "zstd"
+COMPRESSION_LEVEL = 3
+SORTED_BY_METADATA_KEY = "top_antibodies.sorted_by"
+
+
+def _profile(columns):
+    options = dict(compression=COMPRESSION, compression_level=COMPRESSION_LEVEL,
+                   statistics=True, row_group_size=ROW_GROUP_ROWS)
+    if SORT_KEY in columns:
+        options["metadata"] = {SORTED_BY_METADATA_KEY: SORT_KEY}
+    return options
+
+
+def write_parquet(df, path):
+    """Write a DataFrame with the output profile."""
+    if SORT_KEY in df.columns:
+        df = df.sort(SORT_KEY)
+    if is_ipc(path):
+        df.write_ipc(path, compression="uncompressed")
+    else:
+        df.write_parquet(path, **_profile(df.columns))
+
+
+def sink_parquet(lf, path):
+    """Write a LazyFrame with the output profile using the streaming engine."""
+    columns = lf.collect_schema().names()
+    if SORT_KEY in columns:
+        lf = lf.sort(SORT_KEY)
+    if is_ipc(path):
+        lf.sink_ipc(path, compression="uncompressed")
+    else:
+        lf.sink_parquet(path, **_profile(columns))
@@ -0,0 +1,31 @@
+"""Tests of filter.py helpers on small in-memory tables."""
+
+import json
+import math
+import os
+import sys
+
+import polars as pl
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import filter as filter_tool  # noqa: E402
+
+
+def test_summaries_leave_out_infinite_values():
+    df = pl.DataFrame({
+        'Filter_0': [1.0, 2.0, float('inf'), float('-inf'), float('nan'), None, 3.0],
+        'Col0': [float('inf')] * 7,
+    })
+    for table in (df, df.lazy()):
+        summary = filter_tool.column_summaries(table, ['Filter_0', 'Col0'])
+        json.dumps(summary, allow_nan=False)  # no Infinity/NaN in the JSON
+
+        column = summary['columns']['Filter_0']
+        assert (column['missing'], column['infinite']) == (2, 2)
+        assert (column['min'], column['max']) == (1.0, 3.0)
+        assert sum(column['histogram']['counts']) == 3
+        assert all(math.isfinite(edge) for edge in column['histogram']['edges'])
+
+        only_infinite = summary['columns']['Col0']
+        assert (only_infinite['infinite'], only_infinite['min']) == (7, None)
+        assert 'histogram' not in only_infinite
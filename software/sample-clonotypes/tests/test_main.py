@@ -0,0 +1,25 @@
+"""Tests of main.py ranking helpers on small in-memory tables."""
+
+import os
+import sys
+
+import polars as pl
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import main as sample_tool  # noqa: E402
+
+
+def test_streaming_top_n_matches_eager_ranking():
+    df = pl.DataFrame({
+        'clonotypeKey': [f'c{i:02d}' for i in range(12)],
+        'Col0': [3.0, 1.0, None, 2.0, 2.0, float('nan'), 5.0, 1.0, 2.0, 4.0, None, 0.5],
+        'Col1': ['7', '1', '2', '3', '3', '9', None, '4', '8', '6', '5', '0'],
+    })
+    ranking_cols = ['Col0', 'Col1']
+    for directions in (('decreasing', 'increasing'), ('increasing', 'decreasing')):
+        ranking_map = dict(zip(ranking_cols, directions))
+        for n in (1, 5, 12):
+            eager = sample_tool.diversified_rank_and_select(df, n, ranking_map, ranking_cols).drop('ranked_order')
+            top = sample_tool.streaming_top_n(df.lazy(), n, ranking_map, ranking_cols)
+            ranked = sample_tool.diversified_rank_and_select(top, n, ranking_map, ranking_cols).drop('ranked_order')
+            assert ranked.equals(eager), (directions, n)
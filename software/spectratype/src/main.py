@@ -2,6 +2,13 @@ import pandas as pd
 import argparse
 import time
 
+from memory_budget import (default_memory_budget, estimate_parquet_memory, exceeds_budget, format_size,
+                           parse_memory_size)
+from metrics import Metrics
+from result_cache import DEFAULT_CACHE_SIZE, ResultCache, output_formats
+import table_io
+import worker
+
 # Expected input file has clonotypeKey, and one or two cdr3Sequence[.chain] columns, and one or two vGene[.chain] columns
 # Spectratype output file will have chain, cdr3Length, vGene, and count columns
 # V/J usage output file will have chain, vGene, jGene, and count columns
@@ -9,36 +16,29 @@ import time
 # An optional input file can be provided: final_clonotypes.csv 
 # It will have cluster_0,clonotypeKey,top columns (top is 1) and only final clonotypes are included in the file
 
-def main():
-    start_time = time.time()
-    print(f"Starting CDR3 spectratype calculation at {time.strftime('%H:%M:%S')}")
-    
-    parser = argparse.ArgumentParser(description="Calculate CDR3 lengths and output in long format.")
-    parser.add_argument("--input_parquet", required=True, 
-                       help="Input Parquet file with clonotypeKey, cdr3Sequence[.chain], and vGene[.chain] columns.")
-    parser.add_argument("--final-clonotypes", required=False,
-                        help="Input Parquet file with top/filtered clonotypes to calculate spectratype and V/J gene usage only on them.")
-    parser.add_argument("--spectratype_tsv", required=True, 
-                       help="Output TSV file with chain, cdr3Length, vGene, and count columns.")
-    parser.add_argument("--vj_usage_tsv", required=True,
-                        help="Output TSV file with vGene, jGene, and count columns for V/J gene usage.")
-    args = parser.parse_args()
+# Peak memory of the eager pandas path relative to the Arrow size of the input
+# (object strings, the merged copy and the long-format frame)
+EAGER_WORKING_SET_FACTOR = 6
+# Rows per batch when the input is processed in chunks
+CHUNK_ROWS = 500_000
 
-    # Read input data
-    load_start = time.time()
-    df = pd.read_parquet(args.input_parquet)
-    load_time = time.time() - load_start
-    print(f"Data loading: {load_time:.3f}s ({len(df):,} rows, {len(df.columns)} columns)")
+SPECTRATYPE_KEYS = ['chain', 'cdr3Length', 'vGene']
+VJ_USAGE_KEYS = ['chain', 'vGene', 'jGene']
 
-    # Read final clonotypes if provided (now in Parquet format)
-    if args.final_clonotypes:
-        final_clonotypes = pd.read_parquet(args.final_clonotypes)
-        print(f"Loaded final clonotypes: {len(final_clonotypes):,} rows")
-    else:
-        final_clonotypes = None
 
+def count_cdr3_usage(df, final_clonotypes):
+    """
+    Count CDR3 length spectratype and V/J usage for (a chunk of) the input table.
+
+    Args:
+        df: pandas DataFrame with clonotypeKey, cdr3Sequence.*, vGene.* and jGene.* columns
+        final_clonotypes: pandas DataFrame of clonotypes to restrict to, or None
+
+    Returns:
+        tuple of (spectratype counts, V/J usage counts) as pandas Series indexed
+        by SPECTRATYPE_KEYS / VJ_USAGE_KEYS, or (None, None) if no valid CDR3
+    """
     # Merge with final clonotypes using clonotypeKey if provided
-    processing_start = time.time()
     if final_clonotypes is not None:
         df = pd.merge(df, final_clonotypes, on='clonotypeKey', how='inner')
         print(f"Merged with final clonotypes: {len(df):,} rows remaining")
@@ -59,37 +59,157 @@ def main():
     df_long = df_long[df_long['cdr3Length'] > 0].copy()
 
     if df_long.empty:
+        return None, None
+    return df_long.groupby(SPECTRATYPE_KEYS).size(), df_long.groupby(VJ_USAGE_KEYS).size()
+
+
+def usage_tables(spectratype_counts, vj_counts):
+    """
+    Build the sorted output tables from the counts.
+
+    Returns:
+        tuple of (spectratype DataFrame, V/J usage DataFrame)
+    """
+    if spectratype_counts is None:
         # Create empty outputs if no valid data
-        spectratype_df = pd.DataFrame(columns=["chain", "cdr3Length", "vGene", "count"])
-        vj_usage_df = pd.DataFrame(columns=["chain", "vGene", "jGene", "count"])
         print("Warning: No valid CDR3 sequences found")
+        return (pd.DataFrame(columns=SPECTRATYPE_KEYS + ["count"]),
+                pd.DataFrame(columns=VJ_USAGE_KEYS + ["count"]))
+
+    # Generate CDR3 length spectratype
+    spectratype_df = (spectratype_counts
+                     .reset_index(name='count')
+                     .sort_values(['chain', 'cdr3Length']))
+
+    # Generate V/J gene usage
+    vj_usage_df = (vj_counts
+                  .reset_index(name='count')
+                  .sort_values('count'))
+
+    print(f"Generated spectratype: {len(spectratype_df):,} entries")
+    print(f"Generated V/J usage: {len(vj_usage_df):,} entries")
+    return spectratype_df, vj_usage_df
+
+
+def count_cdr3_usage_chunked(input_parquet, final_clonotypes, chunk_rows=CHUNK_ROWS):
+    """
+    count_cdr3_usage over the input in batches of chunk_rows, for inputs over the
+    memory budget: only one batch is decoded at a time and per-batch counts are summed.
+
+    Returns:
+        tuple of (spectratype counts, V/J usage counts, input rows)
+    """
+    if table_io.is_ipc(input_parquet):
+        import pyarrow.feather as feather
+        # Memory-mapped, so batches are views of the file rather than decoded copies
+        table = feather.read_table(input_parquet, memory_map=True)
+        schema = table.schema
+    else:
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(input_parquet)
+        schema = parquet_file.schema_arrow
+
+    columns = [col for col in schema.names
+               if col == 'clonotypeKey' or col.split('.', 1)[0] in ('cdr3Sequence', 'vGene', 'jGene')]
+    if table_io.is_ipc(input_parquet):
+        batches = table.select(columns).to_batches(max_chunksize=chunk_rows)
     else:
-        # Generate CDR3 length spectratype
-        spectratype_df = (df_long
-                         .groupby(['chain', 'cdr3Length', 'vGene'])
-                         .size()
-                         .reset_index(name='count')
-                         .sort_values(['chain', 'cdr3Length']))
-
-        # Generate V/J gene usage
-        vj_usage_df = (df_long
-                      .groupby(['chain', 'vGene', 'jGene'])
-                      .size()
-                      .reset_index(name='count')
-                      .sort_values('count'))
-        
-        print(f"Generated spectratype: {len(spectratype_df):,} entries")
-        print(f"Generated V/J usage: {len(vj_usage_df):,} entries")
+        batches = parquet_file.iter_batches(batch_size=chunk_rows, columns=columns)
+    spectratype_parts, vj_parts = [], []
+    rows = 0
+    for batch in batches:
+        rows += batch.num_rows
+        spectratype_counts, vj_counts = count_cdr3_usage(batch.to_pandas(), final_clonotypes)
+        if spectratype_counts is not None:
+            spectratype_parts.append(spectratype_counts)
+            vj_parts.append(vj_counts)
+    print(f"Processed {rows:,} rows in chunks of {chunk_rows:,}")
+
+    if not spectratype_parts:
+        return None, None, rows
+    return (pd.concat(spectratype_parts).groupby(level=SPECTRATYPE_KEYS).sum(),
+            pd.concat(vj_parts).groupby(level=VJ_USAGE_KEYS).sum(),
+            rows)
+
+
+def main():
+    start_time = time.time()
+    print(f"Starting CDR3 spectratype calculation at {time.strftime('%H:%M:%S')}")
     
-    processing_time = time.time() - processing_start
-    print(f"Processing: {processing_time:.3f}s")
+    parser = argparse.ArgumentParser(description="Calculate CDR3 lengths and output in long format.")
+    parser.add_argument("--input_parquet", required=True, 
+                       help="Input Parquet (or Arrow IPC) file with clonotypeKey, cdr3Sequence[.chain], and vGene[.chain] columns.")
+    parser.add_argument("--final-clonotypes", required=False,
+                        help="Input Parquet (or Arrow IPC) file with top/filtered clonotypes to calculate spectratype and V/J gene usage only on them.")
+    parser.add_argument("--spectratype_tsv", required=True, 
+                       help="Output TSV file with chain, cdr3Length, vGene, and count columns (Arrow IPC for a .arrow name).")
+    parser.add_argument("--vj_usage_tsv", required=True,
+                        help="Output TSV file with vGene, jGene, and count columns for V/J gene usage (Arrow IPC for a .arrow name).")
+    parser.add_argument("--metrics-out", required=False,
+                        help="Append per-stage metrics (JSON lines) to this file.")
+    parser.add_argument("--memory-budget", type=parse_memory_size, required=False,
+                        help="Memory available to the tool, e.g. 16GiB (default: 80%% of the container limit). "
+                             "Inputs that would not fit are processed in chunks.")
+    parser.add_argument("--cache-dir", required=False,
+                        help="Reuse outputs of earlier runs with the same inputs from this directory "
+                             "(default: $TOP_ANTIBODIES_CACHE_DIR; no caching if unset).")
+    parser.add_argument("--cache-size", type=parse_memory_size, default=DEFAULT_CACHE_SIZE,
+                        help=f"Size limit of the result cache (default: {DEFAULT_CACHE_SIZE}).")
+    args = parser.parse_args()
+    metrics = Metrics("spectratype", args.metrics_out)
+
+    # Reuse the outputs of an earlier run on the same inputs
+    cache = ResultCache(args.cache_dir, args.cache_size)
+    cache_outputs = {'spectratype': args.spectratype_tsv, 'vj_usage': args.vj_usage_tsv}
+    cache_key = cache.key("spectratype", [args.input_parquet, args.final_clonotypes],
+                          {'formats': output_formats(cache_outputs)}, cache_outputs)
+    if cache.restore(cache_key, cache_outputs):
+        print(f"Total time: {time.time() - start_time:.3f}s")
+        return
+
+    # Read final clonotypes if provided (now in Parquet format)
+    if args.final_clonotypes:
+        with metrics.stage("load_final_clonotypes") as stage:
+            final_clonotypes = table_io.read_pandas(args.final_clonotypes)
+            stage.rows_out = len(final_clonotypes)
+        print(f"Loaded final clonotypes: {len(final_clonotypes):,} rows")
+    else:
+        final_clonotypes = None
+
+    # Estimate the eager working set from the Parquet metadata before loading
+    budget = args.memory_budget or default_memory_budget()
+    input_rows, estimate = estimate_parquet_memory(args.input_parquet)
+    print(f"Estimated input size: {format_size(estimate)} ({input_rows:,} rows), "
+          f"memory budget: {format_size(budget) if budget else 'unlimited'}")
+
+    if exceeds_budget(estimate, EAGER_WORKING_SET_FACTOR, budget):
+        print(f"Eager processing would need ~{format_size(estimate * EAGER_WORKING_SET_FACTOR)}, "
+              f"processing in chunks")
+        with metrics.stage("process", rows_in=input_rows) as stage:
+            spectratype_counts, vj_counts, rows = count_cdr3_usage_chunked(args.input_parquet, final_clonotypes)
+            spectratype_df, vj_usage_df = usage_tables(spectratype_counts, vj_counts)
+            stage.rows_out = len(spectratype_df) + len(vj_usage_df)
+        metrics.rows(rows_in=rows)
+    else:
+        # Read input data
+        with metrics.stage("load") as stage:
+            df = worker.read_parquet(args.input_parquet, table_io.read_pandas)
+            stage.rows_out = len(df)
+        print(f"Data loading: {stage.wall:.3f}s ({len(df):,} rows, {len(df.columns)} columns)")
+        metrics.rows(rows_in=len(df))
+
+        with metrics.stage("process", rows_in=len(df)) as stage:
+            spectratype_df, vj_usage_df = usage_tables(*count_cdr3_usage(df, final_clonotypes))
+            stage.rows_out = len(spectratype_df) + len(vj_usage_df)
+    print(f"Processing: {stage.wall:.3f}s")
 
     # Write outputs
-    output_start = time.time()
-    spectratype_df.to_csv(args.spectratype_tsv, sep="\t", index=False)
-    vj_usage_df.to_csv(args.vj_usage_tsv, sep="\t", index=False)
-    output_time = time.time() - output_start
-    print(f"Output: {output_time:.3f}s")
+    with metrics.stage("write", rows_in=len(spectratype_df) + len(vj_usage_df)) as stage:
+        table_io.write_pandas_tsv(spectratype_df, args.spectratype_tsv)
+        table_io.write_pandas_tsv(vj_usage_df, args.vj_usage_tsv)
+    print(f"Output: {stage.wall:.3f}s")
+    metrics.rows(rows_out=len(spectratype_df) + len(vj_usage_df))
+    cache.store(cache_key, cache_outputs, time.time() - start_time)
     
     total_time = time.time() - start_time
     print(f"Total time: {total_time:.3f}s")
@@ -0,0 +1,263 @@
+"""
+Result cache for the block's table tools.
+
+Tools started with ``--cache-dir`` (default: ``$TOP_ANTIBODIES_CACHE_DIR``;
+no caching when neither is set) look up their outputs before computing them:
+
+    cache = ResultCache(args.cache_dir, args.cache_size)
+    key = cache.key("filter", inputs=[args.parquet], params={...}, outputs=['out', ...])
+    if cache.restore(key, {'out': args.out, ...}):
+        return
+    ... compute and write outputs ...
+    cache.store(key, {'out': args.out, ...}, seconds)
+
+The key combines a fingerprint of every input Parquet file with the tool's
+parameters and a hash of its code (code_fingerprint), so an upgraded tool
+never reuses results of the previous version. The fingerprint hashes the file
+size and the Parquet footer — the schema, row counts and, per row group and
+column, the encoded sizes and min/max/null-count statistics — so it is cheap
+(no data pages are read) and unaffected by re-materializing the same content
+under a new path or mtime. Parameters include the outputs' formats (see
+output_formats) and are compared as parsed JSON values: whitespace and number
+formatting in ``--filter-map``/``--ranking-map`` don't matter, key order does
+(ranking priority follows it).
+
+Entries are directories of output files under the cache directory, evicted
+least recently used first once their total size exceeds ``--cache-size``.
+
+This module is copied verbatim into every tool's src/ that uses it (each tool
+is packaged from its own src/ root); keep the copies identical.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+CACHE_DIR_ENV = 'TOP_ANTIBODIES_CACHE_DIR'
+DEFAULT_CACHE_SIZE = '2GiB'
+# Bumped when the entry layout or key derivation changes
+CACHE_VERSION = 2
+ENTRY_INFO_FILE = 'entry.json'
+PARQUET_MAGIC = b'PAR1'
+# Directory of the tool's sources (each tool is packaged from its own src/ root)
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# code_fingerprint() of this process, computed on first use
+_code_fingerprint = None
+
+
+def parquet_fingerprint(path):
+    """
+    Content fingerprint of a Parquet file from its size and footer (file metadata
+    with row-group statistics); no data pages are read.
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(str(size).encode())
+        if size >= 12:
+            f.seek(size - 8)
+            footer_length, magic = struct.unpack('<I4s', f.read(8))
+            if magic == PARQUET_MAGIC and footer_length <= size - 12:
+                f.seek(size - 8 - footer_length)
+                digest.update(f.read(footer_length))
+                return digest.hexdigest()
+        # Not a Parquet file (or a truncated one): hash the whole content
+        f.seek(0)
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_fingerprint():
+    """
+    Hash of the tool's sources and pinned requirements (the .py files and
+    requirements.txt in TOOL_DIR), so an upgraded tool doesn't reuse results
+    of the previous version.
+
+    Returns:
+        str: hex digest
+    """
+    global _code_fingerprint
+    if _code_fingerprint is None:
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(TOOL_DIR)):
+            if name.endswith('.py') or name == 'requirements.txt':
+                digest.update(name.encode() + b'\0')
+                with open(os.path.join(TOOL_DIR, name), 'rb') as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+        _code_fingerprint = digest.hexdigest()
+    return _code_fingerprint
+
+
+def json_param(text):
+    """
+    Parsed value of a JSON argument for use in a cache key, so formatting doesn't
+    change the key; invalid JSON is kept as the raw string (the tool reports it).
+    """
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def output_formats(outputs):
+    """
+    File format of each output as its lower-cased extension, for the key
+    parameters: tools choose the format (Parquet, TSV, Arrow IPC) by extension,
+    so runs differing only in output names must not share an entry.
+    """
+    return {name: os.path.splitext(path)[1].lower() for name, path in outputs.items()}
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+class ResultCache:
+    """
+    Size-bounded directory of tool outputs keyed by inputs and parameters.
+
+    Without a directory nothing is cached: ``restore`` always misses and
+    ``store`` does nothing.
+
+    Args:
+        directory: cache directory (created if needed), or None to use $TOP_ANTIBODIES_CACHE_DIR
+        max_bytes: total size of cached entries above which the least recently used are evicted
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or os.environ.get(CACHE_DIR_ENV) or None
+        self.max_bytes = max_bytes
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def fingerprints(self, inputs):
+        """
+        Fingerprints of input files for key(), for callers deriving several keys
+        from the same inputs (fingerprinting a non-Parquet file reads all of it).
+
+        Returns:
+            list | None: fingerprint per input (None for inputs not given), or None when caching is off
+        """
+        if not self.directory:
+            return None
+        return [parquet_fingerprint(path) if path else None for path in inputs]
+
+    def key(self, tool, inputs, params, outputs, fingerprints=None):
+        """
+        Cache key of one tool run.
+
+        Args:
+            tool: tool name
+            inputs: input Parquet paths (None for optional inputs not given)
+            params: JSON-serializable parameters that affect the outputs
+            outputs: names of the outputs the run produces
+            fingerprints: fingerprints(inputs) if already computed
+
+        Returns:
+            str | None: hex key, or None when caching is off
+        """
+        if not self.directory:
+            return None
+        description = {
+            'version': CACHE_VERSION,
+            'code': code_fingerprint(),
+            'tool': tool,
+            'inputs': fingerprints if fingerprints is not None else self.fingerprints(inputs),
+            'params': params,
+            'outputs': sorted(outputs),
+        }
+        return hashlib.sha256(json.dumps(description, separators=(',', ':')).encode()).hexdigest()
+
+    def lookup(self, key):
+        """
+        Directory of a cached entry (its files are named after the outputs), marked as recently used.
+
+        Returns:
+            str | None: entry directory, or None if not cached
+        """
+        if key is None:
+            return None
+        entry = os.path.join(self.directory, key)
+        if not os.path.exists(os.path.join(entry, ENTRY_INFO_FILE)):
+            return None
+        os.utime(entry)
+        return entry
+
+    def restore(self, key, outputs):
+        """
+        Copy a cached entry's files to the output paths.
+
+        Args:
+            key: key from key()
+            outputs: dict of output name to destination path
+
+        Returns:
+            bool: whether the entry was found and restored
+        """
+        if key is None:
+            return False
+        entry = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(entry, ENTRY_INFO_FILE)) as f:
+                info = json.load(f)
+            for name, path in outputs.items():
+                shutil.copyfile(os.path.join(entry, name), path)
+        except (OSError, ValueError):
+            return False
+        os.utime(entry)  # mark as recently used
+        print(f"Result cache hit ({key[:12]}): reused outputs, saved ~{info['seconds']:.3f}s")
+        return True
+
+    def store(self, key, outputs, seconds):
+        """
+        Add the written outputs as a cache entry and evict old entries over the size limit.
+
+        Args:
+            key: key from key()
+            outputs: dict of output name to written output path
+            seconds: compute time the entry saves on a hit
+        """
+        if key is None:
+            return
+        entry = os.path.join(self.directory, key)
+        staging = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+        try:
+            for name, path in outputs.items():
+                shutil.copyfile(path, os.path.join(staging, name))
+            with open(os.path.join(staging, ENTRY_INFO_FILE), 'w') as f:
+                json.dump({'seconds': seconds, 'created': time.time()}, f)
+            os.rename(staging, entry)
+        except OSError:
+            # Entry stored concurrently by another run, or cache not writable
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        if not self.directory or self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            entries.append((os.path.getmtime(path), _directory_size(path), path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Resident worker for repeated interactive runs of this package's tools.
+
+Every run of a tool pays for interpreter start-up, polars/pandas imports and
+decoding the same input Parquet again. The worker is a long-lived local server
+on a Unix socket that keeps the tools imported and recently read input tables
+decoded in memory (LRU, bounded by --cache-size), and runs tool requests
+in-process against them. The client is thin (no polars/pandas import) and takes
+the tool script followed by the tool's usual arguments:
+
+    python worker.py serve [--socket PATH] [--cache-size 4GiB] [--idle-timeout 600]
+    python worker.py run [--socket PATH] [--start] filter.py --parquet in.parquet --out out.parquet ...
+
+``run`` forwards the request to the worker and replays its output and exit
+code; if no worker is listening it starts one (--start) or runs the tool
+locally, so it can always stand in for ``python <tool>.py``. Requests are
+handled one at a time.
+
+Tools read their main input through ``read_parquet(path, reader)``, which goes
+through the cache inside the worker and calls ``reader(path)`` otherwise.
+Cached tables are keyed by path, size and modification time, and must not be
+modified in place by tools.
+
+This module is copied verbatim into every tool's src/ that uses it (each tool
+is packaged from its own src/ root); keep the copies identical.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from collections import OrderedDict
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_SIZE = '4GiB'
+# Seconds without requests after which the worker exits
+DEFAULT_IDLE_TIMEOUT = 600
+# Seconds a client waits for a worker it started to accept connections
+START_TIMEOUT = 30
+# Tool entry scripts the worker runs; the ones missing from a tool's src/ are rejected too
+TOOL_SCRIPTS = ('filter.py', 'main.py')
+
+# Table cache of the running worker; None outside the worker
+_cache = None
+
+
+class TableCache:
+    """
+    LRU cache of decoded tables bounded by their in-memory size.
+
+    Args:
+        max_bytes: total size of cached tables above which the least recently used are evicted
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.tables = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(path, reader):
+        stat = os.stat(path)
+        # Readers of one module (e.g. table_io.read_polars and read_pandas) return
+        # different table types, so the reader is part of the key
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+                getattr(reader, '__module__', None), getattr(reader, '__qualname__', None))
+
+    def get(self, path, reader):
+        key = self.key(path, reader)
+        if key in self.tables:
+            self.tables.move_to_end(key)
+            self.hits += 1
+            return self.tables[key][0]
+
+        self.misses += 1
+        table = reader(path)
+        size = table_size(table)
+        if size <= self.max_bytes:
+            self.tables[key] = (table, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.tables.popitem(last=False)
+                self.total_bytes -= evicted_size
+        return table
+
+
+def table_size(table):
+    """In-memory size of a polars or pandas DataFrame in bytes."""
+    if hasattr(table, 'estimated_size'):
+        return table.estimated_size()
+    return int(table.memory_usage(deep=True).sum())
+
+
+def read_parquet(path, reader):
+    """
+    Read a tool's input table, from the worker's cache when running in the worker.
+
+    Args:
+        path: Parquet file
+        reader: function reading the file, e.g. pl.read_parquet or pd.read_parquet
+
+    Returns:
+        the table returned by reader (possibly shared with earlier requests; do not modify in place)
+    """
+    if _cache is None:
+        return reader(path)
+    return _cache.get(path, reader)
+
+
+def is_cached(path, reader):
+    """Whether read_parquet(path, reader) would return a table already decoded in the worker's cache."""
+    return _cache is not None and TableCache.key(path, reader) in _cache.tables
+
+
+def default_socket_path():
+    """Per-user, per-install socket path, so workers of different packages and users don't collide."""
+    install = hashlib.sha1(TOOL_DIR.encode()).hexdigest()[:12]
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base, f'top-antibodies-worker-{os.getuid()}-{install}.sock')
+
+
+def run_tool(script, argv):
+    """
+    Run a tool script's main() in this process, as ``python <script> <argv>`` would.
+
+    Returns:
+        int: exit code
+    """
+    import importlib
+    import metrics
+
+    module = importlib.import_module(os.path.splitext(os.path.basename(script))[0])
+    saved_argv = sys.argv
+    sys.argv = [script] + list(argv)
+    try:
+        result = module.main()
+        return result if isinstance(result, int) else 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.argv = saved_argv
+        metrics.write_totals()
+
+
+def handle_request(request):
+    """Execute one request and return the response (exit code and captured output)."""
+    script = request['script']
+    if script not in TOOL_SCRIPTS or not os.path.exists(os.path.join(TOOL_DIR, script)):
+        return {'exit_code': 2, 'output': f"worker: unknown tool '{script}'\n"}
+
+    output = io.StringIO()
+    start = time.perf_counter()
+    hits = _cache.hits
+    saved_cwd = os.getcwd()
+    try:
+        os.chdir(request.get('cwd') or saved_cwd)
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            exit_code = run_tool(script, request.get('argv', []))
+    finally:
+        os.chdir(saved_cwd)
+    cached = 'cached input' if _cache.hits > hits else 'input read'
+    print(f"worker: {script} exit {exit_code} in {time.perf_counter() - start:.3f}s ({cached}, "
+          f"{len(_cache.tables)} tables / {_cache.total_bytes / 2**20:.1f} MiB cached)", flush=True)
+    return {'exit_code': exit_code, 'output': output.getvalue()}
+
+
+def serve(socket_path, cache_size, idle_timeout):
+    """Listen on socket_path and handle requests until idle for idle_timeout seconds."""
+    global _cache
+    sys.path.insert(0, TOOL_DIR)
+    # Tools `import worker`; make that this module (not a second copy) so they see the cache
+    sys.modules['worker'] = sys.modules[__name__]
+    _cache = TableCache(cache_size)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)  # socket accessible to this user only
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    server.settimeout(idle_timeout)
+    print(f"worker: listening on {socket_path} (cache {cache_size / 2**30:.1f} GiB, "
+          f"idle timeout {idle_timeout}s)", flush=True)
+
+    try:
+        while True:
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                print("worker: idle timeout, exiting", flush=True)
+                break
+            with connection:
+                connection.settimeout(None)
+                try:
+                    message = _receive(connection)
+                    if not message:
+                        continue  # connection probe from start_worker()
+                    response = handle_request(json.loads(message))
+                except Exception:
+                    response = {'exit_code': 1, 'output': traceback.format_exc()}
+                try:
+                    connection.sendall(json.dumps(response).encode() + b'\n')
+                except OSError as e:
+                    print(f"worker: client went away: {e}", flush=True)
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def _receive(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(1 << 16)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            break
+    return b''.join(chunks).decode()
+
+
+def send_request(socket_path, script, argv):
+    """
+    Send a request to a running worker.
+
+    Returns:
+        dict | None: the worker's response, or None if no worker is listening
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        client.close()
+        return None
+    with client:
+        request = {'script': script, 'argv': list(argv), 'cwd': os.getcwd()}
+        client.sendall(json.dumps(request).encode() + b'\n')
+        return json.loads(_receive(client))
+
+
+def start_worker(socket_path, cache_size, idle_timeout):
+    """Start a detached worker and wait until it accepts connections."""
+    log = open(socket_path + '.log', 'a')
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', '--socket', socket_path,
+                      '--cache-size', str(cache_size), '--idle-timeout', str(idle_timeout)],
+                     stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            return True
+        except (FileNotFoundError, ConnectionRefusedError):
+            time.sleep(0.05)
+        finally:
+            probe.close()
+    return False
+
+
+def run_locally(script, argv):
+    """Run the tool as a normal script in this process (no worker available)."""
+    import runpy
+
+    sys.path.insert(0, TOOL_DIR)
+    sys.argv = [script] + list(argv)
+    runpy.run_path(os.path.join(TOOL_DIR, script), run_name='__main__')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident worker for this package's tools.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Run the worker')
+    run_parser = subparsers.add_parser('run', help='Run a tool through the worker')
+    for sub in (serve_parser, run_parser):
+        sub.add_argument('--socket', default=None, help='Unix socket path (default: per user and install)')
+        sub.add_argument('--cache-size', default=DEFAULT_CACHE_SIZE,
+                         help=f'Memory for cached input tables (default: {DEFAULT_CACHE_SIZE})')
+        sub.add_argument('--idle-timeout', type=int, default=DEFAULT_IDLE_TIMEOUT,
+                         help=f'Seconds without requests before the worker exits (default: {DEFAULT_IDLE_TIMEOUT})')
+    run_parser.add_argument('--start', action='store_true',
+                            help='Start a worker if none is running (default: run the tool locally)')
+    run_parser.add_argument('script', choices=TOOL_SCRIPTS, help='Tool script, e.g. filter.py')
+    run_parser.add_argument('tool_args', nargs=argparse.REMAINDER, help='Arguments of the tool')
+    args = parser.parse_args()
+
+    socket_path = args.socket or default_socket_path()
+    if args.command == 'serve':
+        from memory_budget import parse_memory_size
+        serve(socket_path, parse_memory_size(args.cache_size), args.idle_timeout)
+        return
+
+    response = send_request(socket_path, args.script, args.tool_args)
+    if response is None and args.start and start_worker(socket_path, args.cache_size, args.idle_timeout):
+        response = send_request(socket_path, args.script, args.tool_args)
+    if response is None:
+        sys.exit(run_locally(args.script, args.tool_args))
+    sys.stdout.write(response['output'])
+    sys.exit(response['exit_code'])
+
+
+if __name__ == '__main__':
+    main()
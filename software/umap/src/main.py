@@ -11,82 +11,559 @@ Usage:
         [--umap-neighbors 15] [--umap-min-dist 0.1]
 
 Inputs:
-  - A TSV file (`-i`/`--input`) with at least one column of nucleotide sequences.
+  - A TSV, Parquet (.parquet) or Arrow IPC (.arrow/.ipc/.feather) file (`-i`/`--input`) with
+    at least one column of amino acid sequences; only clonotypeKey and the sequence columns are read.
   - Specify the sequence column starting string with `-c`/`--seq-col-start` (default: "sequence").
 
 Outputs:
-  - A CSV file (`-u`/`--umap-output`) containing the UMAP embeddings for each sequence.
-    Columns will be named UMAP1, UMAP2, etc.
+  - A file (`-u`/`--umap-output`) containing the UMAP embeddings for each sequence: float32
+    Parquet when the name ends in .parquet, TSV otherwise. Columns will be named UMAP1, UMAP2, etc.
 
 Options:
   --pca-components   Number of PCA dimensions before UMAP (default: 10)
   --umap-components  Number of UMAP dimensions (default: 2)
   --umap-neighbors   UMAP n_neighbors (default: 15)
   --umap-min-dist    UMAP min_dist (default: 0.1)
+  --k-mer-features   Hash k-mers into this many features (default: exact k-mer indexing)
+  --reduction        'svd' (default) or bounded-memory 'streaming' reduction before UMAP
+  --chunk-size       Sequences featurized per chunk (default: 100000)
+  --threads          Worker processes for k-mer featurization (default: all CPUs)
+  --landmarks        Fit UMAP on this many stratified landmarks and project the rest (default: 0, off)
+  --model-dir        Save the fitted model here and embed only new clonotypes on later runs
+  --refit            Ignore a saved model and refit from scratch
+  --numba-cache-dir  Base directory for the persistent numba kernel cache
 """
 
 import argparse
-import itertools
 import numpy as np
-import pandas as pd
+import polars as pl
 import sys
 import os
-from scipy.spatial.distance import pdist, squareform
-from sklearn.metrics.pairwise import euclidean_distances
-from sklearn.decomposition import TruncatedSVD
-import umap
+from importlib.metadata import version
 
-def kmer_count_vectors(sequences, k=6):
+from metrics import Metrics
+
+# scikit-learn and umap-learn (and with it numba) are imported where they
+# are used: importing them costs seconds, and numba's cache location has to be
+# configured before umap-learn is first imported.
+
+# Standard amino acid alphabet used for k-mer indexing
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+# Largest k for which every k-mer still has its own int64 index (20**14 < 2**63)
+MAX_EXACT_KMER_SIZE = 14
+# Feature dimension used when k-mers have to be hashed and none was requested
+DEFAULT_HASH_FEATURES = 2 ** 20
+# Number of sequences featurized per chunk (one unit of work for a worker process)
+FEATURIZATION_CHUNK_SIZE = 100_000
+
+# Streaming reduction: dimension of the intermediate sparse random projection, and the
+# largest exact k-mer index space it projects from (beyond it k-mers are hashed)
+STREAMING_PROJECTION_COMPONENTS = 256
+STREAMING_MAX_EXACT_FEATURES = 20 ** 6
+
+# Saved model layout (see --model-dir); bump the version when the model contents change
+MODEL_FORMAT_VERSION = 2
+MODEL_FILE = 'umap_model.joblib'
+EMBEDDINGS_FILE = 'umap_embeddings.parquet'
+# Seeds of the row hashes summed into the input fingerprint (128 bits)
+FINGERPRINT_SEEDS = (0, 1)
+
+# Landmark mode: seed of the landmark subsample and number of points per transform batch
+LANDMARK_SEED = 0
+TRANSFORM_BATCH_SIZE = 50_000
+# umap-learn fits fewer points with exact distances and then transforms by brute
+# force over all landmarks, which is far slower than projecting through its NN index
+MIN_LANDMARKS = 4096
+
+# Directory name of the persistent numba cache under the user cache directory
+NUMBA_CACHE_NAME = 'milaboratories-top-antibodies-umap-numba'
+
+# Input/output formats are chosen by file extension; anything else is TSV
+PARQUET_SUFFIXES = ('.parquet', '.pq')
+IPC_SUFFIXES = ('.arrow', '.ipc', '.feather')
+
+# Whole-sequence pattern accepted by input validation: amino acids and stop codons,
+# case-insensitive, optionally followed by underscores
+VALID_SEQUENCE_PATTERN = r'(?i)^[ACDEFGHIKLMNPQRSTVWY*]*_*$'
+# Number of offending rows printed when input validation fails
+MAX_REPORTED_INVALID_ROWS = 10
+
+# Byte -> amino acid code lookup (lowercase maps like uppercase); anything else is invalid
+_INVALID_CODE = len(AMINO_ACIDS)
+_AA_CODES = np.full(256, _INVALID_CODE, dtype=np.uint8)
+for _code, _aa in enumerate(AMINO_ACIDS):
+    _AA_CODES[ord(_aa)] = _code
+    _AA_CODES[ord(_aa.lower())] = _code
+
+
+def _hash_mix(values):
+    """Scramble uint64 values in place (splitmix64 finalizer) so that hashed
+    k-mers spread evenly over the feature space."""
+    with np.errstate(over='ignore'):
+        values ^= values >> np.uint64(30)
+        values *= np.uint64(0xBF58476D1CE4E5B9)
+        values ^= values >> np.uint64(27)
+        values *= np.uint64(0x94D049BB133111EB)
+        values ^= values >> np.uint64(31)
+    return values
+
+
+def kmer_indices(sequences, k, n_features=None):
+    """
+    Compute the (row, column) position of every k-mer occurrence in the sequences.
+
+    Columns are the base-20 index of the k-mer, computed arithmetically, so no
+    k-mer vocabulary is ever materialized. When n_features is given, k-mers are
+    hashed into that many columns instead.
+
+    Args:
+        sequences (list): List of amino acid sequences
+        k (int): Size of k-mers to count
+        n_features (int): Number of hashed features (None for exact indexing)
+
+    Returns:
+        tuple: (rows, cols) int64 arrays with one entry per k-mer occurrence
+    """
+    num_seqs = len(sequences)
+    if num_seqs == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Encode all sequences into one buffer; the separator is an invalid code, so
+    # no k-mer window can span two sequences. Non-ASCII characters become '?'
+    # (one byte each, also invalid) to keep positions aligned.
+    seqs = [str(s) for s in sequences]
+    buffer = '\n'.join(seqs).encode('ascii', errors='replace')
+    codes = _AA_CODES[np.frombuffer(buffer, dtype=np.uint8)]
+    lengths = np.fromiter(map(len, seqs), dtype=np.int64, count=num_seqs)
+
+    num_windows = len(codes) - k + 1
+    if num_windows <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # A window is a k-mer if none of its characters is invalid
+    valid = np.ones(num_windows, dtype=bool)
+    for j in range(k):
+        valid &= codes[j:j + num_windows] != _INVALID_CODE
+    starts = np.flatnonzero(valid)
+
+    row_of_position = np.repeat(np.arange(num_seqs, dtype=np.int64), lengths + 1)
+    rows = row_of_position[starts]
+
+    if n_features is None:
+        cols = np.zeros(len(starts), dtype=np.int64)
+        for j in range(k):
+            cols *= len(AMINO_ACIDS)
+            cols += codes[starts + j]
+    else:
+        # Polynomial rolling hash (wraps modulo 2**64) followed by a mixing step
+        hashes = np.zeros(len(starts), dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            for j in range(k):
+                hashes *= np.uint64(0x100000001B3)
+                hashes += codes[starts + j].astype(np.uint64) + np.uint64(1)
+        cols = (_hash_mix(hashes) % np.uint64(n_features)).astype(np.int64)
+
+    return rows, cols
+
+
+def _kmer_chunk_matrix(sequences, k, n_features):
+    """
+    Build the k-mer count matrix of one chunk of sequences over the full k-mer
+    index space (20^k columns, or n_features when hashing).
+
+    Args:
+        sequences (list): List of amino acid sequences
+        k (int): Size of k-mers to count
+        n_features (int): Number of hashed features (None for exact indexing)
+
+    Returns:
+        scipy.sparse.csr_matrix: Matrix of k-mer counts with sorted, summed entries
+    """
+    from scipy import sparse
+    rows, cols = kmer_indices(sequences, k, n_features)
+    width = n_features if n_features is not None else len(AMINO_ACIDS) ** k
+    # Duplicate (row, col) pairs are summed into counts
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+        shape=(len(sequences), width),
+        dtype=np.int32,
+    )
+    matrix.sum_duplicates()
+    return matrix
+
+
+def iter_kmer_chunk_matrices(sequences, k, n_features, threads=1, chunk_size=FEATURIZATION_CHUNK_SIZE):
+    """
+    Featurize sequences chunk by chunk, yielding each chunk's k-mer count matrix
+    (see _kmer_chunk_matrix) in input order.
+
+    With threads > 1, chunks are featurized by a pool of worker processes, at most
+    `threads` chunks at a time, so memory stays bounded by the chunk size.
+
+    Args:
+        sequences (list): List of amino acid sequences
+        k (int): Size of k-mers to count
+        n_features (int): Number of hashed features (None for exact indexing)
+        threads (int): Number of worker processes used for featurization
+        chunk_size (int): Number of sequences per featurization chunk
+
+    Yields:
+        scipy.sparse.csr_matrix: k-mer counts of the next chunk
+    """
+    num_seqs = len(sequences)
+    starts = list(range(0, num_seqs, chunk_size)) or [0]
+    print(f"Featurizing {num_seqs} sequences in {len(starts)} chunks using {threads} threads...")
+
+    if threads > 1 and len(starts) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(threads, len(starts))) as pool:
+            for window in range(0, len(starts), threads):
+                futures = [pool.submit(_kmer_chunk_matrix, sequences[i:i + chunk_size], k, n_features)
+                           for i in starts[window:window + threads]]
+                for future in futures:
+                    yield future.result()
+    else:
+        for i in starts:
+            yield _kmer_chunk_matrix(sequences[i:i + chunk_size], k, n_features)
+
+
+def kmer_count_vectors(sequences, k=6, n_features=None, threads=1, chunk_size=FEATURIZATION_CHUNK_SIZE,
+                       columns=None):
     """
     Convert amino acid sequences to k-mer count vectors.
-    
+
+    Sequences are featurized in chunks (in parallel worker processes when
+    threads > 1) and the per-chunk matrices are stacked in input order, so the
+    result does not depend on the number of threads. Only k-mers actually
+    observed in the input become columns, so memory scales with the data instead
+    of with 20^k. Columns keep the order of the full k-mer vocabulary (or of the
+    hashed feature space). Passing the columns of an earlier call featurizes new
+    sequences into the same column space.
+
     Args:
         sequences (list): List of amino acid sequences
         k (int): Size of k-mers to count
-        
+        n_features (int): Number of hashed features (None for exact indexing;
+            required for k > MAX_EXACT_KMER_SIZE, defaults to DEFAULT_HASH_FEATURES)
+        threads (int): Number of worker processes used for featurization
+        chunk_size (int): Number of sequences per featurization chunk
+        columns (numpy.ndarray): Sorted k-mer indices to use as columns (None to
+            use the k-mers observed in the sequences)
+
     Returns:
-        numpy.ndarray: Matrix of k-mer counts
+        tuple: (scipy.sparse.csr_matrix of k-mer counts, numpy.ndarray of the
+        k-mer index of each column)
     """
     print(f"Generating {k}-mer count vectors...")
-    # Standard amino acid alphabet
-    amino_acids = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 
-                   'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y']
-    all_kmers = [''.join(p) for p in itertools.product(amino_acids, repeat=k)]
-    kmer_to_index = {kmer: idx for idx, kmer in enumerate(all_kmers)}
+    if n_features is None and k > MAX_EXACT_KMER_SIZE:
+        n_features = DEFAULT_HASH_FEATURES
+        print(f"k-mer size {k} is too large for exact indexing, hashing into {n_features} features")
 
+    from scipy import sparse
     num_seqs = len(sequences)
-    num_kmers = len(all_kmers)
-    
-    # Use sparse matrix for memory efficiency
+    blocks = list(iter_kmer_chunk_matrices(sequences, k, n_features, threads, chunk_size))
+    matrix = sparse.vstack(blocks, format='csr')
+
+    if columns is None:
+        # Compact columns to the observed k-mers; np.unique keeps them sorted, so
+        # the remapped indices stay sorted within each row
+        columns, indices = np.unique(matrix.indices, return_inverse=True)
+        print(f"Found {len(columns)} distinct {k}-mers in {num_seqs} sequences")
+        matrix = sparse.csr_matrix(
+            (matrix.data, indices, matrix.indptr),
+            shape=(num_seqs, len(columns)),
+        )
+    else:
+        # Map onto the given columns, dropping k-mers outside of them
+        positions = np.searchsorted(columns, matrix.indices)
+        keep = positions < len(columns)
+        keep[keep] = columns[positions[keep]] == matrix.indices[keep]
+        rows = np.repeat(np.arange(num_seqs), np.diff(matrix.indptr))
+        print(f"Mapped {num_seqs} sequences onto {len(columns)} known {k}-mers "
+              f"({int((~keep).sum())} unknown k-mer entries dropped)")
+        matrix = sparse.csr_matrix(
+            (matrix.data[keep], (rows[keep], positions[keep])),
+            shape=(num_seqs, len(columns)),
+        )
+    return matrix, columns
+
+
+def streaming_feature_space(k, n_features):
+    """Number of k-mer features used by the streaming reduction: the full k-mer index
+    space while it is small enough for the random projection, hashed features beyond."""
+    if n_features is None and len(AMINO_ACIDS) ** k > STREAMING_MAX_EXACT_FEATURES:
+        return DEFAULT_HASH_FEATURES
+    return n_features
+
+
+def streaming_fit(sequences, args):
+    """
+    Fit a bounded-memory reduction of k-mer counts to args.dr_components dimensions.
+
+    Every chunk of sequences is featurized, reduced by a sparse random projection
+    to STREAMING_PROJECTION_COMPONENTS dimensions and fed to IncrementalPCA, so
+    only one chunk's k-mer matrix is in memory at a time.
+
+    Args:
+        sequences (list): List of amino acid sequences
+        args (argparse.Namespace): Parsed command-line arguments
+
+    Returns:
+        tuple: (fitted SparseRandomProjection, fitted IncrementalPCA)
+    """
     from scipy import sparse
-    matrix = sparse.lil_matrix((num_seqs, num_kmers), dtype=np.int32)
-
-    # Process sequences in batches
-    batch_size = 1000
-    for i in range(0, num_seqs, batch_size):
-        batch_end = min(i + batch_size, num_seqs)
-        print(f"Processing sequences {i+1} to {batch_end} of {num_seqs}...")
-        
-        for j in range(i, batch_end):
-            seq = str(sequences[j]).upper().strip("_")
-            for pos in range(len(seq) - k + 1):
-                kmer = seq[pos:pos + k]
-                idx = kmer_to_index.get(kmer)
-                if idx is not None:
-                    matrix[j, idx] += 1
-    
-    # Convert to CSR format for efficient operations
-    return matrix.tocsr()
+    from sklearn.decomposition import IncrementalPCA
+    from sklearn.random_projection import SparseRandomProjection
+
+    n_features = streaming_feature_space(args.k_mer_size, args.k_mer_features)
+    width = n_features if n_features is not None else len(AMINO_ACIDS) ** args.k_mer_size
+    print(f"Fitting streaming reduction over {width} {args.k_mer_size}-mer features...")
+
+    # Only the number of input features matters for fitting the projection
+    projection = SparseRandomProjection(
+        n_components=min(STREAMING_PROJECTION_COMPONENTS, width),
+        dense_output=True, random_state=LANDMARK_SEED,
+    ).fit(sparse.csr_matrix((1, width), dtype=np.float32))
+    # IncrementalPCA needs at least n_components rows per batch; main() checks that
+    # chunks are large enough, so only inputs with fewer rows need fewer components
+    n_components = min(args.dr_components, len(sequences))
+    if n_components < args.dr_components:
+        print(f"Warning: only {len(sequences)} sequences, "
+              f"reducing to {n_components} instead of {args.dr_components} components")
+    ipca = IncrementalPCA(n_components=n_components)
+    for block in iter_kmer_chunk_matrices(sequences, args.k_mer_size, n_features, args.threads,
+                                          args.chunk_size):
+        # A short last chunk is only transformed, not fitted
+        if block.shape[0] >= n_components:
+            ipca.partial_fit(projection.transform(block))
+    print(f"Explained variance ratio (of projected k-mer space): {sum(ipca.explained_variance_ratio_):.3f}")
+    return projection, ipca
+
+
+def streaming_transform(projection, ipca, sequences, args):
+    """Reduce sequences chunk by chunk with a fitted streaming reduction (see streaming_fit)."""
+    n_features = streaming_feature_space(args.k_mer_size, args.k_mer_features)
+    reduced = np.empty((len(sequences), ipca.n_components_), dtype=np.float32)
+    offset = 0
+    for block in iter_kmer_chunk_matrices(sequences, args.k_mer_size, n_features, args.threads,
+                                          args.chunk_size):
+        reduced[offset:offset + block.shape[0]] = ipca.transform(projection.transform(block))
+        offset += block.shape[0]
+    return reduced
+
+
+def select_landmarks(strata, n_landmarks, seed=LANDMARK_SEED):
+    """
+    Draw a stratified random subsample of rows.
+
+    Rows are shuffled within each stratum and the strata laid out one after
+    another; taking evenly spaced rows from that order allocates landmarks to
+    each stratum proportionally to its size.
+
+    Args:
+        strata (numpy.ndarray): Stratum label of each row (e.g. sequence length)
+        n_landmarks (int): Number of rows to select
+        seed (int): Random seed
+
+    Returns:
+        numpy.ndarray: Sorted indices of the selected rows
+    """
+    num_rows = len(strata)
+    if n_landmarks >= num_rows:
+        return np.arange(num_rows)
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(num_rows), strata))
+    picks = (np.arange(n_landmarks) * num_rows) // n_landmarks
+    return np.sort(order[picks])
+
+
+def umap_transform(reducer, data, batch_size=TRANSFORM_BATCH_SIZE):
+    """
+    Embed new points with a fitted UMAP reducer, in batches.
+
+    Batches are transformed one after another in this process; transform is
+    already parallel (numba). A process pool does not help: workers forked after
+    the numba-parallel fit can hang, and spawned ones re-import umap and unpickle
+    the reducer for every worker.
+
+    Args:
+        reducer (umap.UMAP): Fitted UMAP reducer
+        data (numpy.ndarray): Points in the reducer's input space
+        batch_size (int): Number of points per batch
+
+    Returns:
+        numpy.ndarray: Embeddings of the points
+    """
+    batches = [data[i:i + batch_size] for i in range(0, len(data), batch_size)]
+    print(f"Projecting {len(data)} points in {len(batches)} batches...")
+    results = [reducer.transform(batch) for batch in batches]
+    return np.vstack(results).astype(np.float32)
+
+
+def fit_umap(data, args, strata=None):
+    """
+    Fit UMAP and embed all points.
+
+    With args.landmarks set and more points than landmarks, UMAP is fitted on a
+    subsample stratified by `strata` and the remaining points are projected with
+    transform; otherwise UMAP is fitted on all points.
+
+    Args:
+        data (numpy.ndarray): Points to embed (SVD output)
+        args (argparse.Namespace): Parsed command-line arguments
+        strata (numpy.ndarray): Stratum label of each point for landmark sampling
+
+    Returns:
+        tuple: (fitted umap.UMAP reducer, numpy.ndarray of embeddings)
+    """
+    import umap
+    umap_model = umap.UMAP(
+        n_components=args.umap_components,
+        n_neighbors=args.umap_neighbors,
+        min_dist=args.umap_min_dist,
+        n_jobs=-1  # Use all available cores
+    )
+    if not args.landmarks or len(data) <= args.landmarks:
+        return umap_model, umap_model.fit_transform(data)
+
+    n_landmarks = args.landmarks
+    if n_landmarks < MIN_LANDMARKS:
+        n_landmarks = MIN_LANDMARKS
+        print(f"Raising number of landmarks from {args.landmarks} to {n_landmarks}")
+        if len(data) <= n_landmarks:
+            return umap_model, umap_model.fit_transform(data)
+
+    if strata is None:
+        strata = np.zeros(len(data), dtype=np.int64)
+    landmarks = select_landmarks(strata, n_landmarks)
+    print(f"Fitting UMAP on {len(landmarks)} landmarks out of {len(data)} points...")
+    embedding = np.empty((len(data), args.umap_components), dtype=np.float32)
+    embedding[landmarks] = umap_model.fit_transform(data[landmarks])
+    rest = np.ones(len(data), dtype=bool)
+    rest[landmarks] = False
+    embedding[rest] = umap_transform(umap_model, data[rest])
+    return umap_model, embedding
+
+
+def configure_numba_cache(base_dir=None):
+    """
+    Point numba's on-disk kernel cache to a persistent directory, so umap-learn and
+    pynndescent kernels compiled by one run are reused by the next.
+
+    The cache lives in a subdirectory of base_dir named after the Python, numba,
+    umap-learn and pynndescent versions, so upgrading any of them starts a fresh
+    cache. A NUMBA_CACHE_DIR set in the environment is used as given. Has to be
+    called before umap-learn is imported.
+
+    Args:
+        base_dir (str): Base cache directory (None for $NUMBA_CACHE_DIR if set,
+            else ~/.cache/NUMBA_CACHE_NAME)
+
+    Returns:
+        str: The cache directory in use
+    """
+    if base_dir is None:
+        if os.environ.get('NUMBA_CACHE_DIR'):
+            return os.environ['NUMBA_CACHE_DIR']
+        base_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), NUMBA_CACHE_NAME)
+    tag = (f"py{sys.version_info.major}.{sys.version_info.minor}"
+           f"-numba{version('numba')}-umap{version('umap-learn')}-pynndescent{version('pynndescent')}")
+    cache_dir = os.path.join(base_dir, tag)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        print(f"Warning: Could not create numba cache directory {cache_dir}: {e}")
+        return os.environ.get('NUMBA_CACHE_DIR')
+    os.environ['NUMBA_CACHE_DIR'] = cache_dir
+    return cache_dir
+
+
+def model_settings(args):
+    """Settings that must match for a saved model to be reused."""
+    return {
+        'format': MODEL_FORMAT_VERSION,
+        'umap_version': version('umap-learn'),
+        'k_mer_size': args.k_mer_size,
+        'k_mer_features': args.k_mer_features,
+        'dr_components': args.dr_components,
+        'umap_components': args.umap_components,
+        'umap_neighbors': args.umap_neighbors,
+        'umap_min_dist': args.umap_min_dist,
+        'landmarks': args.landmarks,
+        'reduction': args.reduction,
+    }
+
+
+def input_fingerprint(df, seq_col):
+    """Fingerprint of the clonotype keys and sequences, in input order (nulls
+    allowed). Stored with the saved model to recognize an input identical to the
+    one of the saved embeddings.
+
+    Each row (position, key, sequence) is hashed with polars and the row hashes
+    are summed, for two seeds, without copying the columns into Python. Polars
+    hashes are not stable across polars versions; a changed fingerprint only
+    means cached embeddings are matched by key and sequence instead."""
+    row = pl.struct(pl.int_range(pl.len(), dtype=pl.UInt64).alias('row'), pl.col('clonotypeKey'), pl.col(seq_col))
+    sums = df.select(row.hash(seed).sum().alias(str(seed)) for seed in FINGERPRINT_SEEDS).row(0)
+    return f"{df.height}:" + ''.join(f'{value:016x}' for value in sums)
+
+
+def load_model(model_dir, settings):
+    """
+    Load a saved SVD+UMAP model and its cached embeddings.
+
+    Args:
+        model_dir (str): Directory the model was saved to
+        settings (dict): Current model settings (see model_settings)
+
+    Returns:
+        tuple: (model dict, embeddings polars DataFrame), or None when there is no
+        saved model or it was fitted with different settings
+    """
+    import joblib
+    model_path = os.path.join(model_dir, MODEL_FILE)
+    embeddings_path = os.path.join(model_dir, EMBEDDINGS_FILE)
+    if not (os.path.exists(model_path) and os.path.exists(embeddings_path)):
+        print(f"No saved model found in {model_dir}")
+        return None
+    try:
+        model = joblib.load(model_path)
+        embeddings = pl.read_parquet(embeddings_path)
+    except Exception as e:
+        print(f"Warning: Could not load saved model from {model_dir}: {e}")
+        return None
+    if model.get('settings') != settings:
+        print(f"Saved model in {model_dir} was fitted with different settings: {model.get('settings')}")
+        return None
+    return model, embeddings
+
+
+def save_model(model_dir, model, embeddings):
+    """Save the SVD+UMAP model and the embeddings of the current input."""
+    import joblib
+    os.makedirs(model_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(model_dir, MODEL_FILE))
+    embeddings.write_parquet(os.path.join(model_dir, EMBEDDINGS_FILE))
+    print(f"Saved model and {embeddings.height} embeddings to {model_dir}")
+
+def scan_input(path):
+    """Lazily scan the input table: Parquet and Arrow IPC by file extension, TSV otherwise."""
+    if path.endswith(PARQUET_SUFFIXES):
+        return pl.scan_parquet(path)
+    if path.endswith(IPC_SUFFIXES):
+        return pl.scan_ipc(path)
+    return pl.scan_csv(path, separator='\t', infer_schema=False)
+
 
 def main():
     parser = argparse.ArgumentParser(
         description='Compute UMAP embeddings from amino acid sequences via k-mer counts and PCA.')
     parser.add_argument('-i', '--input', required=True,
-                        help='Input TSV file with sequence column')
+                        help='Input TSV, Parquet or Arrow IPC file with clonotypeKey and sequence columns')
     parser.add_argument('-c', '--seq-col-start', default='aaSequence',
                         help='Starting string of the column containing amino acid sequences')
     parser.add_argument('-u', '--umap-output', required=True,
-                        help='Output TSV file for UMAP embeddings')
+                        help='Output file for UMAP embeddings: float32 Parquet for a .parquet name, TSV otherwise')
     parser.add_argument('--dr-components', type=int, default=5,
                         help='Number of dimensionality reduction components before UMAP (default: 5)')
     parser.add_argument('--umap-components', type=int, default=2,
@@ -97,9 +574,37 @@ def main():
                         help='UMAP min_dist (default: 0.05)')
     parser.add_argument('--k-mer-size', type=int, default=3,
                         help='Size of k-mers to use for sequence analysis (default: 3 for amino acids)')
+    parser.add_argument('--k-mer-features', type=int, default=None,
+                        help='Hash k-mers into this many features instead of indexing them exactly '
+                             f'(default: exact indexing; {DEFAULT_HASH_FEATURES} features for k-mer size > {MAX_EXACT_KMER_SIZE})')
+    parser.add_argument('--reduction', choices=['svd', 'streaming'], default='svd',
+                        help="Dimensionality reduction before UMAP: 'svd' (TruncatedSVD on the full k-mer matrix) "
+                             "or 'streaming' (chunked random projection + IncrementalPCA, memory bounded by "
+                             "--chunk-size) (default: svd)")
+    parser.add_argument('--chunk-size', type=int, default=FEATURIZATION_CHUNK_SIZE,
+                        help=f'Number of sequences featurized per chunk (default: {FEATURIZATION_CHUNK_SIZE})')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes for k-mer featurization (default: all available CPUs)')
+    parser.add_argument('--landmarks', type=int, default=0,
+                        help='Fit UMAP on a subsample of this many clonotypes, stratified by sequence length, '
+                             'and project the rest with transform (default: 0, fit on all clonotypes)')
+    parser.add_argument('--model-dir', default=None,
+                        help='Directory to save the fitted SVD+UMAP model to and reuse it from, '
+                             'so later runs only embed new clonotypes')
+    parser.add_argument('--refit', action='store_true',
+                        help='Refit the model from scratch even if a compatible saved model exists')
     parser.add_argument('--output-dir', default='.',
                         help='Directory to save output files')
+    parser.add_argument('--numba-cache-dir', default=None,
+                        help='Base directory for the persistent numba kernel cache '
+                             '(default: $NUMBA_CACHE_DIR, or ~/.cache/' + NUMBA_CACHE_NAME + ')')
+    parser.add_argument('--metrics-out', default=None,
+                        help='Append per-stage metrics (JSON lines) to this file')
     args = parser.parse_args()
+    metrics = Metrics('umap', args.metrics_out)
+
+    cache_dir = configure_numba_cache(args.numba_cache_dir)
+    print(f"Numba cache directory: {cache_dir}")
 
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
@@ -129,78 +634,197 @@ def main():
     if args.k_mer_size < 1:
         print("Error: k-mer size must be at least 1")
         sys.exit(1)
+    if args.k_mer_features is not None and args.k_mer_features < 1:
+        print("Error: Number of k-mer features must be at least 1")
+        sys.exit(1)
+    if args.landmarks < 0:
+        print("Error: Number of landmarks must not be negative")
+        sys.exit(1)
+    if args.threads < 1:
+        print("Error: Number of threads must be at least 1")
+        sys.exit(1)
+    if args.chunk_size < 1:
+        print("Error: Chunk size must be at least 1")
+        sys.exit(1)
+    if args.reduction == 'streaming' and args.chunk_size < args.dr_components:
+        print("Error: Chunk size must be at least the number of dimensionality reduction components "
+              "for streaming reduction")
+        sys.exit(1)
 
     # Load input with better error handling
     try:
         print("Loading input file...")
-        df_input = pd.read_csv(args.input, sep='\t', dtype=str)
-        print(f"Loaded {len(df_input)} sequences")
+        lf_input = scan_input(args.input)
+        input_columns = lf_input.collect_schema().names()
     except FileNotFoundError:
         print(f"Error: Input file '{args.input}' not found")
         sys.exit(1)
-    except pd.errors.EmptyDataError:
+    except pl.exceptions.NoDataError:
         print("Error: Input file is empty")
         sys.exit(1)
     except Exception as e:
         print(f"Error reading input file: {e}")
         sys.exit(1)
 
-    seq_col_list = sorted([c for c in df_input.columns 
+    seq_col_list = sorted([c for c in input_columns
                         if c.startswith(args.seq_col_start)])
     if len(seq_col_list) == 0:
-        print(f"Error: Columns starting with '{args.seq_col_start}' not found in input TSV. Available columns: {', '.join(df_input.columns)}")
+        print(f"Error: Columns starting with '{args.seq_col_start}' not found in input. Available columns: {', '.join(input_columns)}")
         sys.exit(1)
 
-    # Concatenate sequence columns
+    # Read only the key and sequence columns, concatenating sequence columns
     seq_col = "aaSequence"
-    df_input[seq_col] = df_input[seq_col_list].agg(''.join, axis=1)
-    
-    sequences = df_input[seq_col].tolist()
-    if not sequences:
+    try:
+        with metrics.stage('load') as stage:
+            df_input = lf_input.select(
+                pl.col("clonotypeKey").cast(pl.Utf8),
+                pl.concat_str([pl.col(c).cast(pl.Utf8).fill_null("") for c in seq_col_list]).alias(seq_col),
+            ).collect()
+            stage.rows_out = df_input.height
+        print(f"Loaded {df_input.height} sequences")
+    except Exception as e:
+        print(f"Error reading input file: {e}")
+        sys.exit(1)
+    metrics.rows(rows_in=df_input.height)
+
+    if df_input.height == 0:
         print('Error: No sequences found in the specified column.')
         sys.exit(1)
-    
-    # Validate sequences for amino acids
-    valid_aas = {'A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 
-                 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y', '*'}
-    invalid_seqs = []
-    for i, seq in enumerate(sequences):
-        # Remove trailing underscore and check each character
-        seq = str(seq).upper().rstrip("_")
-        if not all(aa in valid_aas for aa in seq):
-            invalid_seqs.append(i)
-    if invalid_seqs:
-        print(f"Error: Invalid amino acid sequences found at rows: {invalid_seqs}")
-        sys.exit(1)
-
-    # Compute k-mer counts
-    print("Computing k-mer counts...")
-    matrix = kmer_count_vectors(sequences, k=args.k_mer_size)
-    
-    # Run truncated SVD
-    print("Running Truncated SVD...")
-    svd = TruncatedSVD(n_components=args.dr_components)
-    svd_embed = svd.fit_transform(matrix)
-    print(f"Explained variance ratio: {sum(svd.explained_variance_ratio_):.3f}")
-    
-    # Run UMAP
-    print("Running UMAP...")
-    umap_model = umap.UMAP(
-        n_components=args.umap_components,
-        n_neighbors=args.umap_neighbors,
-        min_dist=args.umap_min_dist,
-        n_jobs=-1  # Use all available cores
+
+    # Validate sequences for amino acids (trailing underscores are allowed)
+    invalid = (
+        df_input.with_row_index("row")
+        .filter(~pl.col(seq_col).str.contains(VALID_SEQUENCE_PATTERN))
     )
-    umap_embed = umap_model.fit_transform(svd_embed)
+    if invalid.height > 0:
+        print(f"Error: {invalid.height} invalid amino acid sequences found, "
+              f"first {min(invalid.height, MAX_REPORTED_INVALID_ROWS)}:")
+        for row, key, seq in invalid.head(MAX_REPORTED_INVALID_ROWS).iter_rows():
+            print(f"  row {row} ({key}): {seq}")
+        sys.exit(1)
+
+    sequences = df_input[seq_col].to_list()
+
+    umap_cols = [f'UMAP{i+1}' for i in range(args.umap_components)]
+    settings = model_settings(args)
+    fingerprint = input_fingerprint(df_input, seq_col) if args.model_dir else None
+
+    saved = None
+    if args.model_dir and not args.refit:
+        saved = load_model(args.model_dir, settings)
+
+    if saved is None:
+        # UMAP's spectral initialization needs more points than umap_components + 1
+        if len(sequences) < args.umap_components + 2:
+            print(f"Error: {len(sequences)} sequences, at least {args.umap_components + 2} are needed "
+                  f"to fit a {args.umap_components}-dimensional UMAP")
+            sys.exit(1)
+        if args.reduction == 'streaming':
+            # Featurize and reduce chunk by chunk, never holding the full k-mer matrix
+            print("Running streaming dimensionality reduction...")
+            columns, svd = None, None
+            with metrics.stage('reduce', rows_in=len(sequences)) as stage:
+                projection, ipca = streaming_fit(sequences, args)
+                svd_embed = streaming_transform(projection, ipca, sequences, args)
+                stage.rows_out = len(svd_embed)
+        else:
+            # Compute k-mer counts
+            print("Computing k-mer counts...")
+            with metrics.stage('featurize', rows_in=len(sequences)) as stage:
+                matrix, columns = kmer_count_vectors(sequences, k=args.k_mer_size, n_features=args.k_mer_features,
+                                                     threads=args.threads, chunk_size=args.chunk_size)
+                stage.rows_out = matrix.shape[0]
+
+            # Run truncated SVD
+            print("Running Truncated SVD...")
+            from sklearn.decomposition import TruncatedSVD
+            projection, ipca = None, None
+            # Only observed k-mers are columns, so short or few sequences can leave
+            # fewer features than requested components (TruncatedSVD needs more)
+            n_components = min(args.dr_components, matrix.shape[1] - 1)
+            if n_components < 1:
+                print(f"Error: {matrix.shape[1]} distinct {args.k_mer_size}-mers in the input sequences, "
+                      f"at least 2 are needed (are the sequences shorter than --k-mer-size?)")
+                sys.exit(1)
+            if n_components < args.dr_components:
+                print(f"Warning: only {matrix.shape[1]} distinct {args.k_mer_size}-mers, "
+                      f"reducing to {n_components} instead of {args.dr_components} components")
+            with metrics.stage('reduce', rows_in=matrix.shape[0]) as stage:
+                svd = TruncatedSVD(n_components=n_components)
+                svd_embed = svd.fit_transform(matrix)
+                stage.rows_out = len(svd_embed)
+            print(f"Explained variance ratio: {sum(svd.explained_variance_ratio_):.3f}")
+
+        # Run UMAP, stratifying landmarks (if any) by sequence length
+        print("Running UMAP...")
+        with metrics.stage('umap', rows_in=len(svd_embed)) as stage:
+            umap_model, umap_embed = fit_umap(svd_embed, args,
+                                              strata=df_input[seq_col].str.len_chars().to_numpy())
+            stage.rows_out = len(umap_embed)
+
+        model = {
+            'settings': settings,
+            'fingerprint': fingerprint,
+            'columns': columns,
+            'svd': svd,
+            'projection': projection,
+            'ipca': ipca,
+            'umap': umap_model,
+        }
+    else:
+        model, cached = saved
+        if model['fingerprint'] == fingerprint:
+            print("Input is unchanged since the saved run, reusing all cached embeddings")
+            umap_embed = cached.select(umap_cols).to_numpy().astype(np.float32)
+            is_new = np.zeros(df_input.height, dtype=bool)
+        else:
+            # Reuse cached coordinates for clonotypes whose sequence did not change
+            df_joined = df_input.join(
+                cached.unique(subset=["clonotypeKey", seq_col], keep="first", maintain_order=True),
+                on=["clonotypeKey", seq_col], how="left", maintain_order="left")
+            is_new = df_joined[umap_cols[0]].is_null().to_numpy()
+            umap_embed = df_joined.select(umap_cols).to_numpy().astype(np.float32)
+            print(f"Reusing cached embeddings for {int((~is_new).sum())} clonotypes, "
+                  f"embedding {int(is_new.sum())} new clonotypes")
+            model['fingerprint'] = fingerprint
+
+        if is_new.any():
+            new_sequences = [seq for seq, new in zip(sequences, is_new) if new]
+            with metrics.stage('reduce', rows_in=len(new_sequences)) as stage:
+                if args.reduction == 'streaming':
+                    print("Reducing new clonotypes with saved streaming reduction...")
+                    svd_embed = streaming_transform(model['projection'], model['ipca'], new_sequences, args)
+                else:
+                    print("Computing k-mer counts for new clonotypes...")
+                    matrix, _ = kmer_count_vectors(new_sequences, k=args.k_mer_size, n_features=args.k_mer_features,
+                                                   threads=args.threads, chunk_size=args.chunk_size,
+                                                   columns=model['columns'])
+                    svd_embed = model['svd'].transform(matrix)
+                stage.rows_out = len(svd_embed)
+            print("Projecting new clonotypes with saved UMAP model...")
+            with metrics.stage('umap_transform', rows_in=len(svd_embed)) as stage:
+                umap_embed[is_new] = umap_transform(model['umap'], svd_embed)
+                stage.rows_out = len(svd_embed)
+
+    if args.model_dir:
+        with metrics.stage('save_model', rows_in=df_input.height):
+            embeddings = df_input.with_columns(
+                pl.Series(col, umap_embed[:, i], dtype=pl.Float32) for i, col in enumerate(umap_cols)
+            )
+            save_model(args.model_dir, model, embeddings)
 
     # Save UMAP embeddings
     output_path = os.path.join(args.output_dir, args.umap_output)
-    umap_df = pd.DataFrame(
-        umap_embed,
-        index=df_input.clonotypeKey,
-        columns=[f'UMAP{i+1}' for i in range(args.umap_components)]
-    )
-    umap_df.to_csv(output_path, index=True, sep='\t')
+    with metrics.stage('write', rows_in=df_input.height) as stage:
+        umap_df = df_input.select("clonotypeKey").with_columns(
+            pl.Series(col, umap_embed[:, i], dtype=pl.Float32) for i, col in enumerate(umap_cols)
+        )
+        if output_path.endswith(PARQUET_SUFFIXES):
+            umap_df.write_parquet(output_path)
+        else:
+            umap_df.write_csv(output_path, separator='\t')
+        stage.rows_out = umap_df.height
+    metrics.rows(rows_out=umap_df.height)
     print(f'UMAP embeddings saved to {output_path}')
     print("Analysis complete")
 
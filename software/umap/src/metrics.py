@@ -0,0 +1,159 @@
+"""
+Per-stage run metrics for the block's software tools.
+
+Each tool wraps its stages in ``metrics.stage(...)`` and, when started with
+``--metrics-out``, appends one JSON object per stage to that file:
+
+    {"tool": "filter", "stage": "load", "status": "ok", "wall_seconds": 0.412,
+     "cpu_seconds": 0.398, "peak_rss_mb": 211.3, "rows_in": null, "rows_out": 100000, ...}
+
+plus a final ``"stage": "total"`` record from Metrics creation to exit (or to
+``write_totals()``, which the resident worker calls after each request). Records are
+flushed as they are written, so a crashed run still reports the stages it
+finished and the one that failed (``"status": "error"``).
+
+cpu_seconds includes finished child processes (process pools); peak_rss_mb is
+the process high-water mark at the end of the stage, so it only grows between
+stages — the stage where it jumps is the one that allocated.
+
+This module is copied verbatim into every tool's src/ (each tool is packaged
+from its own src/ root); keep the copies identical.
+"""
+
+import atexit
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Metrics whose total record has not been written yet
+_pending_totals = []
+
+
+def _cpu_seconds():
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Stage:
+    """
+    One measured stage. Set ``rows_in``/``rows_out`` (and any extra
+    JSON-serializable fields via ``extra``) inside the ``with`` block; ``wall``
+    holds the elapsed seconds once the block exits.
+    """
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.extra = {}
+        self.wall = None
+
+
+class Metrics:
+    """
+    Collects stage records for one tool run and writes them as JSON lines.
+
+    Without a path nothing is written, but stages are still timed so callers
+    can print ``stage.wall``.
+
+    Args:
+        tool: tool name stored in every record
+        path: JSON-lines output file (appended to), or None
+    """
+
+    def __init__(self, tool, path=None):
+        self.tool = tool
+        self.path = path
+        self._start_wall = time.perf_counter()
+        self._start_cpu = _cpu_seconds()
+        self._rows_in = None
+        self._rows_out = None
+        self._failed = False
+        if path:
+            _pending_totals.append(self)
+
+    def stage(self, name, rows_in=None):
+        """Context manager measuring one stage; yields a Stage."""
+        return _StageContext(self, Stage(name, rows_in))
+
+    def rows(self, rows_in=None, rows_out=None):
+        """Record the run's overall rows in/out for the total record."""
+        if rows_in is not None:
+            self._rows_in = rows_in
+        if rows_out is not None:
+            self._rows_out = rows_out
+
+    def _write(self, record):
+        if not self.path:
+            return
+        record = {'tool': self.tool, **record, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def _write_total(self):
+        self._write({
+            'stage': 'total',
+            'status': 'error' if self._failed else 'ok',
+            'wall_seconds': round(time.perf_counter() - self._start_wall, 3),
+            'cpu_seconds': round(_cpu_seconds() - self._start_cpu, 3),
+            'peak_rss_mb': _peak_rss_mb(),
+            'rows_in': self._rows_in,
+            'rows_out': self._rows_out,
+            'pid': os.getpid(),
+        })
+
+
+def write_totals():
+    """Write the total record of every Metrics created since the last call."""
+    while _pending_totals:
+        _pending_totals.pop(0)._write_total()
+
+
+atexit.register(write_totals)
+
+
+class _StageContext:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = _cpu_seconds()
+        return self.stage
+
+    def __exit__(self, exc_type, exc, tb):
+        stage = self.stage
+        stage.wall = time.perf_counter() - self._wall
+        record = {
+            'stage': stage.name,
+            'status': 'ok' if exc_type is None else 'error',
+            'wall_seconds': round(stage.wall, 3),
+            'cpu_seconds': round(_cpu_seconds() - self._cpu, 3),
+            'peak_rss_mb': _peak_rss_mb(),
+            'rows_in': stage.rows_in,
+            'rows_out': stage.rows_out,
+        }
+        if exc_type is not None:
+            self.metrics._failed = True
+            record['error'] = f"{exc_type.__name__}: {exc}"
+        record.update(stage.extra)
+        self.metrics._write(record)
+        return False
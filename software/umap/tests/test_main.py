@@ -0,0 +1,75 @@
+"""End-to-end runs of the UMAP tool on small synthetic inputs."""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import polars as pl
+
+MAIN = os.path.join(os.path.dirname(__file__), '..', 'src', 'main.py')
+# Seconds an end-to-end run may take before it counts as hung
+RUN_TIMEOUT = 300
+
+
+def write_input(path, rows, min_length=8, max_length=16, seed=0):
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list('ACDEFGHIKLMNPQRSTVWY'))
+    sequences = [''.join(rng.choice(alphabet, size=rng.integers(min_length, max_length + 1))) for _ in range(rows)]
+    pl.DataFrame({'clonotypeKey': [f'c{i}' for i in range(rows)], 'aaSequence': sequences}).write_parquet(path)
+
+
+def run_tool(tmp_path, *args):
+    return subprocess.run([sys.executable, MAIN, '-i', str(tmp_path / 'input.parquet'),
+                           '-u', str(tmp_path / 'umap.parquet'), '--output-dir', str(tmp_path), *args],
+                          capture_output=True, text=True, timeout=RUN_TIMEOUT)
+
+
+def test_landmarks_project_with_threads(tmp_path):
+    write_input(tmp_path / 'input.parquet', rows=4600)
+    result = run_tool(tmp_path, '--landmarks', '4096', '--threads', '2')
+    assert result.returncode == 0, result.stdout + result.stderr
+    embedding = pl.read_parquet(tmp_path / 'umap.parquet')
+    assert embedding.height == 4600
+    assert embedding.select(pl.col('UMAP1', 'UMAP2').is_nan().any()).row(0) == (False, False)
+
+
+def test_fewer_kmers_than_components(tmp_path):
+    # 4 distinct 3-mers (AAA, CCC, ACA, CAC) for 5 requested SVD components
+    sequences = ['AAAA', 'CCCC', 'ACAC'] * 20
+    pl.DataFrame({'clonotypeKey': [f'c{i}' for i in range(len(sequences))],
+                  'aaSequence': sequences}).write_parquet(tmp_path / 'input.parquet')
+    result = run_tool(tmp_path, '--dr-components', '5', '--k-mer-size', '3')
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'reducing to 3 instead of 5 components' in result.stdout
+    assert pl.read_parquet(tmp_path / 'umap.parquet').height == len(sequences)
+
+
+def test_sequences_shorter_than_k(tmp_path):
+    write_input(tmp_path / 'input.parquet', rows=50, min_length=1, max_length=2)
+    result = run_tool(tmp_path, '--k-mer-size', '3')
+    assert result.returncode == 1
+    assert 'at least 2 are needed' in result.stdout
+
+
+def test_streaming_reduction_of_few_sequences(tmp_path):
+    write_input(tmp_path / 'input.parquet', rows=4)
+    result = run_tool(tmp_path, '--reduction', 'streaming', '--dr-components', '5')
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'reducing to 4 instead of 5 components' in result.stdout
+    assert pl.read_parquet(tmp_path / 'umap.parquet').height == 4
+
+
+def test_too_few_sequences_for_umap(tmp_path):
+    write_input(tmp_path / 'input.parquet', rows=3)
+    for reduction in ('svd', 'streaming'):
+        result = run_tool(tmp_path, '--reduction', reduction)
+        assert result.returncode == 1
+        assert 'Error: 3 sequences, at least 4 are needed' in result.stdout
+
+
+def test_streaming_chunk_smaller_than_components(tmp_path):
+    write_input(tmp_path / 'input.parquet', rows=50)
+    result = run_tool(tmp_path, '--reduction', 'streaming', '--dr-components', '5', '--chunk-size', '3')
+    assert result.returncode == 1
+    assert 'Error: Chunk size must be at least' in result.stdout